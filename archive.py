@@ -0,0 +1,129 @@
+import os
+import json
+import struct
+from encryption import CHUNK_SIZE
+from container import FLAG_ARCHIVE, ContainerReader, write_container, rechunk
+from batch import scan_tree
+
+# Archive plaintext: member contents back to back, then the table of contents as JSON,
+# then a trailer with the TOC offset and length. All of it is encrypted by the container,
+# so member names and sizes are never stored in the clear.
+TOC_TRAILER = struct.Struct(">QQ")
+ARCHIVE_VERSION = 1
+READ_SIZE = 64 * 1024
+
+def _archive_blocks(members, toc):
+    """Yield member contents followed by the TOC and trailer, filling toc as it goes."""
+    offset = 0
+    for name, path in members:
+        stat = os.stat(path)
+        size = 0
+        with open(path, "rb") as fin:
+            for block in iter(lambda: fin.read(READ_SIZE), b""):
+                size += len(block)
+                yield block
+        toc.append({"name": name, "offset": offset, "size": size, "mtime": stat.st_mtime})
+        offset += size
+    toc_bytes = json.dumps({"version": ARCHIVE_VERSION, "members": toc}).encode("utf-8")
+    yield toc_bytes
+    yield TOC_TRAILER.pack(offset, len(toc_bytes))
+
+def pack_files(members, out_path, key, method="Fernet", chunk_size=CHUNK_SIZE, workers=None, progress_tracker=None,
+               compression=None):
+    """
+    Pack many files into one encrypted archive container.
+
+    Args:
+        members (list): (archive name, file path) pairs.
+        out_path (str): Archive file to create.
+        key (bytes): Key for method.
+        method (str): Container method (see container.METHODS).
+        chunk_size (int): Plaintext bytes per encrypted chunk, shared by all members.
+        workers (int): Worker count for chunk encryption.
+        progress_tracker (ProgressTracker): Receives packed/total bytes.
+        compression (str): Optional per-chunk compression codec (see container.write_container).
+
+    Returns:
+        list: The table of contents entries (name, offset, size, mtime).
+    """
+    total = sum(os.path.getsize(path) for _, path in members)
+    progress = None
+    if progress_tracker:
+        progress = lambda processed: progress_tracker.update_progress(min(processed, total), total)
+    toc = []
+    with open(out_path, "wb") as fout:
+        write_container(fout, rechunk(_archive_blocks(members, toc), chunk_size), key, method, chunk_size,
+                        workers, flags=FLAG_ARCHIVE, progress=progress, compression=compression)
+    return toc
+
+def pack_directory(src_dir, out_path, key, method="Fernet", chunk_size=CHUNK_SIZE, workers=None, progress_tracker=None,
+                   compression=None):
+    """Pack every file under src_dir, named by its path relative to src_dir."""
+    members = [(rel_path.replace(os.sep, "/"), os.path.join(src_dir, rel_path))
+               for rel_path, _ in sorted(scan_tree(src_dir))]
+    return pack_files(members, out_path, key, method, chunk_size, workers, progress_tracker, compression)
+
+class ArchiveReader:
+    """Lists and extracts archive members, decrypting only the chunks each read touches."""
+    def __init__(self, path, key):
+        self.fin = open(path, "rb")
+        try:
+            self.reader = ContainerReader(self.fin, key)
+            if not self.reader.header.flags & FLAG_ARCHIVE:
+                raise ValueError("Container is not an archive")
+            toc_offset, toc_length = TOC_TRAILER.unpack(
+                self.reader.read(self.reader.size - TOC_TRAILER.size, TOC_TRAILER.size))
+            toc = json.loads(self.reader.read(toc_offset, toc_length).decode("utf-8"))
+        except Exception:
+            self.fin.close()
+            raise
+        self.members = {member["name"]: member for member in toc["members"]}
+
+    def list(self):
+        """Return the TOC entries in archive order."""
+        return sorted(self.members.values(), key=lambda member: member["offset"])
+
+    def read(self, name):
+        """Return the contents of one member."""
+        if name not in self.members:
+            raise KeyError(f"No such archive member: {name}")
+        member = self.members[name]
+        return self.reader.read(member["offset"], member["size"])
+
+    def extract(self, name, out_dir):
+        """Write one member under out_dir, recreating its relative path, and return the output path."""
+        member = self.members.get(name)
+        if member is None:
+            raise KeyError(f"No such archive member: {name}")
+        out_path = os.path.normpath(os.path.join(out_dir, *name.split("/")))
+        if os.path.commonpath([os.path.abspath(out_dir), os.path.abspath(out_path)]) != os.path.abspath(out_dir):
+            raise ValueError(f"Archive member escapes the output directory: {name}")
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with open(out_path, "wb") as fout:
+            for offset in range(member["offset"], member["offset"] + member["size"], CHUNK_SIZE):
+                fout.write(self.reader.read(offset, min(CHUNK_SIZE, member["offset"] + member["size"] - offset)))
+        os.utime(out_path, (member["mtime"], member["mtime"]))
+        return out_path
+
+    def extract_all(self, out_dir):
+        """Extract every member in archive order, so each chunk is decrypted once."""
+        return [self.extract(member["name"], out_dir) for member in self.list()]
+
+    def close(self):
+        self.fin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def list_archive(path, key):
+    """Return the table of contents of an archive."""
+    with ArchiveReader(path, key) as archive:
+        return archive.list()
+
+def extract_member(path, name, key, out_dir):
+    """Extract a single member without decrypting the rest of the archive."""
+    with ArchiveReader(path, key) as archive:
+        return archive.extract(name, out_dir)
@@ -0,0 +1,162 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from encryption import DEFAULT_WORKERS, encrypt_file_with_password, decrypt_file_with_password
+from container import encrypt_container, decrypt_container
+from progress_visualization import PROGRESS_RATE_HZ, ProgressTracker
+from metrics import record_error
+
+# Blocking crypto and I/O run here; jobs beyond this many wait their turn instead of each
+# getting a thread, so one event loop can submit hundreds of them.
+MAX_CONCURRENT_JOBS = DEFAULT_WORKERS
+JOB_WORKERS = 1  # Chunk workers per job; concurrency comes from running many jobs
+
+_executor = None
+_executor_lock = threading.Lock()
+
+class OperationCancelled(Exception):
+    """Raised inside a worker thread to stop a job whose coroutine was cancelled."""
+
+def default_executor():
+    """Return the shared bounded executor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="securevault")
+        return _executor
+
+class AsyncProgress(ProgressTracker):
+    """
+    ProgressTracker that can be consumed with `async for processed, total in progress`.
+
+    Updates come from the worker thread and are coalesced, first to ProgressTracker's rate
+    limit and then for a slow consumer, which sees the latest (processed, total) rather than
+    a backlog; mb_per_second and eta are kept up to date as well. Iteration ends when the job
+    finishes. A total of 0 means the size is unknown.
+    """
+    def __init__(self, rate_hz=PROGRESS_RATE_HZ):
+        super().__init__(rate_hz=rate_hz)
+        self._loop = None
+        self._changed = None
+        self._latest = None
+        self._done = False
+        self._cancelled = threading.Event()
+
+    def _event(self):
+        # Created lazily so it belongs to the running loop (Python < 3.10 binds at construction)
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _bind(self, loop):
+        self._event()
+        self._loop = loop
+
+    def update_progress(self, processed, total):
+        if self._cancelled.is_set():
+            raise OperationCancelled("Operation cancelled")
+        super().update_progress(processed, total)
+
+    def _emit(self, processed, total):
+        super()._emit(processed, total)
+        self._latest = (processed, total)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    def _finish(self):
+        self.finish()
+        self._done = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        changed = self._event()
+        while True:
+            if changed.is_set():
+                changed.clear()
+                if self._latest is not None:
+                    latest, self._latest = self._latest, None
+                    return latest
+            if self._done:
+                raise StopAsyncIteration
+            await changed.wait()
+
+async def _run(func, args, kwargs, progress, out_path=None, executor=None, operation="encrypt"):
+    """
+    Run a blocking job on the executor with progress reported through an AsyncProgress.
+
+    Cancelling the awaiting task makes the job raise OperationCancelled at its next progress
+    update (i.e. after the current chunk or pass), and any partial out_path is removed.
+    """
+    loop = asyncio.get_running_loop()
+    progress = progress if progress is not None else AsyncProgress()
+    progress._bind(loop)
+
+    def job():
+        try:
+            return func(*args, progress_tracker=progress, **kwargs)
+        except Exception as e:
+            if not progress._cancelled.is_set():
+                record_error(operation, e)
+            elif out_path and os.path.exists(out_path):
+                os.remove(out_path)
+            raise
+
+    future = loop.run_in_executor(executor or default_executor(), job)
+    try:
+        return await future
+    except asyncio.CancelledError:
+        progress._cancelled.set()
+        raise
+    finally:
+        progress._finish()
+
+async def encrypt_file(in_path, out_path, key, method="Fernet", progress=None, workers=JOB_WORKERS,
+                       compression=None, executor=None):
+    """
+    Encrypt a file into a v2 container without blocking the event loop.
+
+    Args:
+        in_path (str): Plaintext file.
+        out_path (str): Container file to create.
+        key (bytes): Key for method (see container.METHODS).
+        method (str): Container method.
+        progress (AsyncProgress): Optional; iterate it to follow the job.
+        workers (int): Chunk workers inside this job.
+        compression (str): Optional per-chunk compression codec.
+        executor (Executor): Defaults to the shared bounded executor.
+    """
+    await _run(encrypt_container, (in_path, out_path, key, method),
+               {"workers": workers, "compression": compression}, progress, out_path, executor)
+
+async def decrypt_file(in_path, out_path, key, progress=None, workers=JOB_WORKERS, executor=None):
+    """Decrypt a v2 container without blocking the event loop."""
+    await _run(decrypt_container, (in_path, out_path, key), {"workers": workers}, progress, out_path, executor,
+               "decrypt")
+
+async def encrypt_file_password(password, in_path, out_path, method="Fernet", progress=None,
+                                workers=JOB_WORKERS, kdf="PBKDF2-SHA256", kdf_params=None, executor=None):
+    """Password-based encrypt_file_with_password run on the executor, KDF included."""
+    await _run(encrypt_file_with_password, (password, in_path, out_path, method),
+               {"workers": workers, "kdf": kdf, "kdf_params": kdf_params}, progress, out_path, executor)
+
+async def decrypt_file_password(password, in_path, out_path, progress=None, workers=JOB_WORKERS, executor=None):
+    """Password-based decrypt_file_with_password run on the executor."""
+    await _run(decrypt_file_with_password, (password, in_path, out_path), {"workers": workers},
+               progress, out_path, executor, "decrypt")
+
+def _wipe(path, method, progress_tracker):
+    from secure_wipe import wipe_drive  # loguru and joblib; import when first needed
+    wipe_drive(path, method, progress_tracker.update_progress)
+
+async def wipe(path, method, progress=None, executor=None):
+    """
+    Securely wipe path with a WipeMethod without blocking the event loop.
+
+    Progress is reported as (passes done, total passes); cancellation takes effect between passes.
+    """
+    await _run(_wipe, (path, method), {}, progress, executor=executor, operation="wipe")
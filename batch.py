@@ -0,0 +1,197 @@
+import os
+import json
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from encryption import DEFAULT_WORKERS
+from container import EXT_WRAPPED_KEY, encrypt_container, decrypt_container, read_header, is_container, rewrap
+
+MANIFEST_NAME = "manifest.json"
+LARGE_FILE_THRESHOLD = 64 * 1024 * 1024  # Files this big get chunk-level parallelism instead of a pool slot
+ENCRYPTED_SUFFIX = ".enc"
+
+RewrapResult = namedtuple("RewrapResult", "path skipped error")
+
+def scan_tree(root):
+    """
+    Walk a directory with os.scandir and return (relative path, size) for every regular file.
+
+    Symlinks are not followed; 'System Volume Information' is skipped as in secure_wipe.
+    """
+    files = []
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != 'System Volume Information':
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append((os.path.relpath(entry.path, root), entry.stat(follow_symlinks=False).st_size))
+    return files
+
+def _tree_path(root, rel_path):
+    """Join a relative path from a manifest onto root; raises ValueError if the result is outside root."""
+    path = os.path.normpath(os.path.join(root, rel_path))
+    root = os.path.abspath(root)
+    try:
+        inside = os.path.commonpath([root, os.path.abspath(path)]) == root
+    except ValueError:  # Paths on different drives
+        inside = False
+    if not inside:
+        raise ValueError(f"Manifest path escapes the directory: {rel_path}")
+    return path
+
+class _BatchProgress:
+    """Thread-safe byte counter forwarding totals to a ProgressTracker."""
+    def __init__(self, progress_tracker, total):
+        self.progress_tracker = progress_tracker
+        self.total = total
+        self.processed = 0
+        self.lock = threading.Lock()
+
+    def add(self, size):
+        with self.lock:
+            self.processed += size
+            processed = self.processed
+        if self.progress_tracker:
+            self.progress_tracker.update_progress(processed, self.total)
+
+def _run_jobs(jobs, job_func, workers, progress):
+    """
+    Run (size, ...) jobs: large ones one at a time with all workers on their chunks,
+    then small ones spread over a file-level pool with one worker each.
+    """
+    large = [job for job in jobs if job[0] >= LARGE_FILE_THRESHOLD]
+    small = [job for job in jobs if job[0] < LARGE_FILE_THRESHOLD]
+    for job in sorted(large, key=lambda job: job[0], reverse=True):
+        job_func(job, workers)
+        progress.add(job[0])
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Biggest first keeps the pool busy until the end (longest-processing-time scheduling)
+        futures = [(job, executor.submit(job_func, job, 1))
+                   for job in sorted(small, key=lambda job: job[0], reverse=True)]
+        for job, future in futures:
+            future.result()
+            progress.add(job[0])
+
+def encrypt_tree(src_dir, dst_dir, key, method="Fernet", workers=None, progress_tracker=None, compression=None):
+    """
+    Encrypt every file under src_dir into a mirrored tree of v2 containers under dst_dir.
+
+    A manifest (MANIFEST_NAME in dst_dir) records the source path, size, method and output
+    path of each file. Note that it stores file names in plaintext.
+
+    Args:
+        src_dir (str): Directory to encrypt.
+        dst_dir (str): Output directory, created if missing.
+        key (bytes): Key for method.
+        method (str): Container method (see container.METHODS).
+        workers (int): Parallelism for both the file pool and chunk encryption (default: DEFAULT_WORKERS).
+        progress_tracker (ProgressTracker): Receives processed/total plaintext bytes.
+        compression (str): Optional per-chunk compression codec (see container.write_container).
+
+    Returns:
+        list: Manifest entries; failed files carry an "error" field instead of stopping the batch.
+    """
+    workers = workers or DEFAULT_WORKERS
+    files = scan_tree(src_dir)
+    manifest = []
+    for rel_path, size in files:
+        manifest.append({"source": rel_path, "size": size, "method": method,
+                         "output": rel_path + ENCRYPTED_SUFFIX})
+    for directory in {os.path.dirname(entry["output"]) for entry in manifest}:
+        os.makedirs(os.path.join(dst_dir, directory), exist_ok=True)
+
+    def encrypt_job(job, chunk_workers):
+        _, entry = job
+        try:
+            encrypt_container(os.path.join(src_dir, entry["source"]), os.path.join(dst_dir, entry["output"]),
+                              key, method, workers=chunk_workers, compression=compression)
+        except Exception as e:
+            entry["error"] = str(e)
+
+    progress = _BatchProgress(progress_tracker, sum(size for _, size in files))
+    _run_jobs([(entry["size"], entry) for entry in manifest], encrypt_job, workers, progress)
+    write_manifest(dst_dir, manifest)
+    return manifest
+
+def decrypt_tree(src_dir, dst_dir, key, workers=None, progress_tracker=None):
+    """
+    Decrypt a tree written by encrypt_tree back to its original layout under dst_dir.
+
+    Uses the manifest when present; otherwise every *.enc container under src_dir is decrypted
+    with the suffix removed. Manifest entries whose paths lead outside src_dir or dst_dir
+    are not decrypted and get an "error" field.
+
+    Returns:
+        list: Entries processed, with an "error" field on failures.
+    """
+    workers = workers or DEFAULT_WORKERS
+    manifest_path = os.path.join(src_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        manifest = [dict(entry) for entry in read_manifest(src_dir) if "error" not in entry]
+    else:
+        manifest = []
+        for rel_path, size in scan_tree(src_dir):
+            if rel_path.endswith(ENCRYPTED_SUFFIX):
+                manifest.append({"source": rel_path[:-len(ENCRYPTED_SUFFIX)], "size": size, "output": rel_path})
+    jobs = []
+    for entry in manifest:
+        try:  # The manifest is not authenticated, so its paths must not lead out of either directory
+            jobs.append((entry["size"], entry, _tree_path(src_dir, entry["output"]),
+                         _tree_path(dst_dir, entry["source"])))
+        except ValueError as e:
+            entry["error"] = str(e)
+    for directory in {os.path.dirname(out_path) for _, _, _, out_path in jobs}:
+        os.makedirs(directory, exist_ok=True)
+
+    def decrypt_job(job, chunk_workers):
+        _, entry, in_path, out_path = job
+        try:
+            with open(in_path, "rb") as fin:
+                entry["method"] = read_header(fin).method
+            decrypt_container(in_path, out_path, key, workers=chunk_workers)
+        except Exception as e:
+            entry["error"] = str(e)
+
+    progress = _BatchProgress(progress_tracker, sum(job[0] for job in jobs))
+    _run_jobs(jobs, decrypt_job, workers, progress)
+    return manifest
+
+def rewrap_tree(root, old_kek, new_kek, workers=None):
+    """
+    Rotate the key-encryption key of every envelope container under root.
+
+    Only each file's header is rewritten, so this costs a few small writes per file however
+    large the tree is. Containers without a wrapped key are skipped, and other files are
+    not listed at all.
+
+    Returns:
+        list: RewrapResult (relative path, skipped, error or None) for each container.
+    """
+    def rewrap_one(rel_path):
+        path = os.path.join(root, rel_path)
+        try:
+            with open(path, "rb") as fin:
+                if EXT_WRAPPED_KEY not in read_header(fin).extensions:
+                    return RewrapResult(rel_path, True, None)
+            rewrap(path, old_kek, new_kek)
+        except Exception as e:
+            return RewrapResult(rel_path, False, str(e) or type(e).__name__)
+        return RewrapResult(rel_path, False, None)
+
+    paths = [rel_path for rel_path, _ in scan_tree(root) if is_container(os.path.join(root, rel_path))]
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS) as executor:
+        return list(executor.map(rewrap_one, sorted(paths)))
+
+def write_manifest(directory, manifest):
+    """Write manifest entries as JSON to MANIFEST_NAME in directory."""
+    with open(os.path.join(directory, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": manifest}, f, indent=2)
+
+def read_manifest(directory):
+    """Read the manifest entries written by encrypt_tree."""
+    with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)["files"]
@@ -0,0 +1,205 @@
+"""
+Offline throughput benchmark suite with JSON results and baseline comparison.
+
+Covers encrypt_file_in_chunks/decrypt_file_in_chunks for every cipher method across a
+matrix of chunk and file sizes, the streaming container methods, each password KDF at its
+default cost, the password file path end to end, and secure_wipe_file with every WipeMethod.
+Every metric is "higher is better" (MB/s or operations/s).
+
+    python benchmarks/bench_suite.py --out results.json
+    python benchmarks/bench_suite.py --baseline baseline.json          # exit 1 on regression
+    python benchmarks/bench_suite.py --quick --save-baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from encryption import (encrypt_file_in_chunks, decrypt_file_in_chunks, encrypt_data_fernet, decrypt_data_fernet,
+                        encrypt_data_aes, decrypt_data_aes, encrypt_data_chacha20, decrypt_data_chacha20, derive_key, encrypt_file_with_password,
+                        decrypt_file_with_password, KDF_DEFAULTS)
+from container import encrypt_container, decrypt_container
+from key_manager import generate_fernet_key
+
+MB = 1024 * 1024
+CHUNK_SIZES = (256 * 1024, MB, 4 * MB)
+FILE_SIZES = (4 * MB, 64 * MB)
+QUICK_CHUNK_SIZES = (MB,)
+QUICK_FILE_SIZES = (4 * MB,)
+REGRESSION_TOLERANCE = 0.10  # Fail when a metric drops more than this fraction below the baseline
+REPEAT = 3
+
+# Method -> (key factory, encrypt function, decrypt function)
+CHUNKED_METHODS = {
+    "Fernet": (generate_fernet_key, encrypt_data_fernet, decrypt_data_fernet),
+    "AES-128-CFB": (partial(os.urandom, 16), encrypt_data_aes, decrypt_data_aes),
+    "AES-192-CFB": (partial(os.urandom, 24), encrypt_data_aes, decrypt_data_aes),
+    "AES-256-CFB": (partial(os.urandom, 32), encrypt_data_aes, decrypt_data_aes),
+    "AES-256-GCM": (partial(os.urandom, 32), partial(encrypt_data_aes, mode="GCM"),
+                    partial(decrypt_data_aes, mode="GCM")),
+    "ChaCha20-Poly1305": (partial(os.urandom, 32), encrypt_data_chacha20, decrypt_data_chacha20),
+}
+CONTAINER_METHODS = ("AES-256-GCM-STREAM", "ChaCha20-Poly1305-STREAM")
+
+def best_time(func, cleanup=None, repeat=REPEAT):
+    """Best wall-clock time of repeat calls; cleanup runs untimed before each call."""
+    elapsed = float("inf")
+    for _ in range(repeat):
+        if cleanup:
+            cleanup()
+        start = time.perf_counter()
+        func()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed
+
+def _remover(path):
+    def remove():
+        if os.path.exists(path):
+            os.remove(path)  # Truncating the previous output would be timed too
+    return remove
+
+def write_random(path, size):
+    with open(path, "wb") as f:
+        for _ in range(size // MB):
+            f.write(os.urandom(MB))
+        f.write(os.urandom(size % MB))
+
+def bench_chunked(tmp, plain, size, chunk_sizes, workers):
+    results = {}
+    enc, dec = os.path.join(tmp, "enc"), os.path.join(tmp, "dec")
+    for chunk_size in chunk_sizes:
+        for method, (make_key, encrypt_func, decrypt_func) in CHUNKED_METHODS.items():
+            key = make_key()
+            name = f"chunked/{method}/chunk={chunk_size // 1024}K/file={size // MB}M"
+            seconds = best_time(lambda: encrypt_file_in_chunks(encrypt_func, key, plain, enc, workers=workers,
+                                                               chunk_size=chunk_size), _remover(enc))
+            results[f"{name}/encrypt"] = size / MB / seconds
+            seconds = best_time(lambda: decrypt_file_in_chunks(decrypt_func, key, enc, dec, workers=workers),
+                                _remover(dec))
+            results[f"{name}/decrypt"] = size / MB / seconds
+    return results
+
+def bench_container(tmp, plain, size, chunk_sizes, workers):
+    results = {}
+    enc, dec = os.path.join(tmp, "enc"), os.path.join(tmp, "dec")
+    for chunk_size in chunk_sizes:
+        for method in CONTAINER_METHODS:
+            key = os.urandom(32)
+            name = f"container/{method}/chunk={chunk_size // 1024}K/file={size // MB}M"
+            seconds = best_time(lambda: encrypt_container(plain, enc, key, method, chunk_size, workers=workers),
+                                _remover(enc))
+            results[f"{name}/encrypt"] = size / MB / seconds
+            seconds = best_time(lambda: decrypt_container(enc, dec, key, workers=workers), _remover(dec))
+            results[f"{name}/decrypt"] = size / MB / seconds
+    return results
+
+def bench_kdfs():
+    results = {}
+    for kdf, (_, params) in KDF_DEFAULTS.items():
+        try:
+            seconds = best_time(lambda: derive_key("benchmark", b"\x00" * 16, 32, kdf, params))
+        except ValueError as e:  # Argon2id on cryptography < 44
+            print(f"  skipped {kdf}: {e}")
+            continue
+        results[f"kdf/{kdf}/derive"] = 1 / seconds
+    return results
+
+def bench_password(tmp, plain, size, workers):
+    results = {}
+    enc, dec = os.path.join(tmp, "enc"), os.path.join(tmp, "dec")
+    for method in ("Fernet", "AES-256"):
+        name = f"password/{method}/file={size // MB}M"
+        # key_cache=None so every run pays for the KDF, as a first unlock does; fixed costs, not this
+        # machine's calibration, so results stay comparable with a baseline
+        seconds = best_time(lambda: encrypt_file_with_password("benchmark", plain, enc, method, workers=workers,
+                                                               key_cache=None,
+                                                               kdf_params=KDF_DEFAULTS["PBKDF2-SHA256"][1]),
+                            _remover(enc))
+        results[f"{name}/encrypt"] = size / MB / seconds
+        seconds = best_time(lambda: decrypt_file_with_password("benchmark", enc, dec, workers=workers,
+                                                               key_cache=None), _remover(dec))
+        results[f"{name}/decrypt"] = size / MB / seconds
+    return results
+
+def bench_wipe(tmp, size):
+    try:
+        from secure_wipe import get_available_wipe_methods, secure_wipe_file
+    except ImportError as e:  # loguru/joblib not installed
+        print(f"  skipped wipe benchmarks: {e}")
+        return {}
+    results = {}
+    target = os.path.join(tmp, "wipe")
+    for name, method in get_available_wipe_methods().items():
+        write_random(target, size)
+        seconds = best_time(lambda: secure_wipe_file(target, method.passes, method.patterns, delete_after=False),
+                            repeat=1)
+        # secure_wipe_file writes each pass's pattern and then zeros
+        results[f"wipe/{name}/file={size // MB}M"] = size * method.passes * 2 / MB / seconds
+    os.remove(target)
+    return results
+
+def environment():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def run_suite(quick=False, workers=1):
+    chunk_sizes = QUICK_CHUNK_SIZES if quick else CHUNK_SIZES
+    file_sizes = QUICK_FILE_SIZES if quick else FILE_SIZES
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "plain")
+        for size in file_sizes:
+            print(f"file size {size // MB} MB")
+            write_random(plain, size)
+            results.update(bench_chunked(tmp, plain, size, chunk_sizes, workers))
+            results.update(bench_container(tmp, plain, size, chunk_sizes, workers))
+            results.update(bench_password(tmp, plain, size, workers))
+            results.update(bench_wipe(tmp, size))
+        results.update(bench_kdfs())
+    return {"environment": environment(), "workers": workers, "results": results}
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Return the metrics that fell more than tolerance below the baseline, as (name, old, new)."""
+    regressions = []
+    for name, old in baseline["results"].items():
+        new = report["results"].get(name)
+        if new is not None and new < old * (1 - tolerance):
+            regressions.append((name, old, new))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON and fail on regressions")
+    parser.add_argument("--save-baseline", help="Write results JSON here for later --baseline runs")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--quick", action="store_true", help="One chunk size and one small file size")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.quick, args.workers)
+    for name, value in sorted(report["results"].items()):
+        print(f"  {name:70s} {value:10.2f}")
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.2f} -> {new:.2f} ({(new / old - 1) * 100:+.1f}%)")
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed more than {args.tolerance:.0%} against {args.baseline}")
+            return 1
+        print(f"No regressions against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
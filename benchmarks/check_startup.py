@@ -0,0 +1,57 @@
+"""
+Import-time regression check for the headless CLI.
+
+Runs `python -X importtime` on what each cli subcommand imports and fails (exit status 1)
+if the median cumulative import time goes over STARTUP_BUDGET_MS, or if a heavy module
+the CLI should never need is loaded.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The encrypt set measures 80-175 ms across machines, nearly all of it loading cryptography's
+# bindings; the budget leaves room for that spread and still fails if a GUI-sized import creeps in
+STARTUP_BUDGET_MS = 250
+RUNS = 5
+# Subcommand -> modules it imports beyond cli itself
+SUBCOMMAND_IMPORTS = {
+    "help": [],
+    "keygen": ["key_manager"],
+    "encrypt": ["container", "encryption"],
+}
+FORBIDDEN_MODULES = ("PySide6", "matplotlib", "openai", "bcrypt", "wmi", "numpy", "psutil")
+
+def import_time_ms(modules):
+    """Return (cumulative top-level import time in ms, forbidden modules loaded) for one cold run."""
+    code = ("import sys, cli\n"
+            f"for name in {modules!r}: __import__(name)\n"
+            f"print(','.join(m for m in {FORBIDDEN_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # Top-level imports only; nested ones are inside their parent
+            total_us += int(cumulative)
+    return total_us / 1000, [name for name in result.stdout.strip().split(",") if name]
+
+def main(budget_ms=STARTUP_BUDGET_MS):
+    failed = False
+    for subcommand, modules in SUBCOMMAND_IMPORTS.items():
+        runs = [import_time_ms(modules) for _ in range(RUNS)]
+        median = statistics.median(ms for ms, _ in runs)
+        forbidden = runs[0][1]
+        status = "ok"
+        if median > budget_ms or forbidden:
+            status = "FAIL"
+            failed = True
+        print(f"{subcommand:8s} {median:7.1f} ms (budget {budget_ms} ms) {status}"
+              + (f" loads {', '.join(forbidden)}" if forbidden else ""))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else STARTUP_BUDGET_MS))
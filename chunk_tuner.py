@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import threading
+import tempfile
+from functools import partial
+from encryption import (DEFAULT_WORKERS, IN_FLIGHT_PER_WORKER, PIPELINE_QUEUE_DEPTH, CHUNK_SIZE, MAX_TUNED_CHUNK_SIZE,
+                        process_chunks)
+
+# Candidate plaintext chunk sizes, smallest first
+TUNE_CHUNK_SIZES = (64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, MAX_TUNED_CHUNK_SIZE)
+PROBE_BYTES = 32 * 1024 * 1024  # Data pushed through the pipeline per candidate
+PROBE_MIN_CHUNKS = 4
+MEMORY_BUDGET_FRACTION = 8  # In-flight chunks may use at most 1/8 of available memory
+TUNING_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".securevault", "chunk_sizes.json")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def memory_budget() -> int:
+    """Bytes the in-flight plaintext and ciphertext chunks of one file may use."""
+    import psutil
+    return psutil.virtual_memory().available // MEMORY_BUDGET_FRACTION
+
+def _peak_memory(chunk_size, workers):
+    # Plaintext and ciphertext buffers for every chunk in flight, plus those queued for or held by
+    # the reader and writer stages (the pool sizes of encryption._encrypt_file_buffered)
+    return 2 * chunk_size * (workers * IN_FLIGHT_PER_WORKER + 2 * PIPELINE_QUEUE_DEPTH + 2)
+
+def candidate_sizes(workers, budget=None, candidates=TUNE_CHUNK_SIZES):
+    """Candidates whose in-flight memory fits the budget; the smallest is always kept."""
+    budget = memory_budget() if budget is None else budget
+    fitting = [size for size in candidates if _peak_memory(size, workers) <= budget]
+    return fitting or [min(candidates)]
+
+def probe_throughput(encrypt_chunks, chunk_size, directory, probe_bytes=PROBE_BYTES):
+    """
+    Encrypt probe_bytes of random data in chunk_size pieces and write it to a temporary
+    file in directory, fsync included, so the probe sees the target storage device.
+
+    Args:
+        encrypt_chunks (callable): Maps an iterable of plaintext chunks to ciphertext blocks.
+
+    Returns:
+        float: Plaintext MB/s.
+    """
+    count = max(PROBE_MIN_CHUNKS, probe_bytes // chunk_size)
+    data = os.urandom(chunk_size)
+    with tempfile.TemporaryFile(dir=directory) as fout:
+        start = time.perf_counter()
+        for block in encrypt_chunks(data for _ in range(count)):
+            fout.write(block)
+        fout.flush()
+        os.fsync(fout.fileno())
+        elapsed = time.perf_counter() - start
+    return count * chunk_size / (1024 * 1024) / max(elapsed, 1e-9)
+
+def probe_chunk_sizes(encrypt_chunks_for, directory, workers=None, candidates=TUNE_CHUNK_SIZES,
+                      probe_bytes=PROBE_BYTES, budget=None):
+    """
+    Measure every candidate chunk size that fits the memory budget.
+
+    Args:
+        encrypt_chunks_for (callable): chunk_size -> encrypt_chunks callable for probe_throughput.
+        directory (str): Directory on the storage device being tuned for.
+
+    Returns:
+        dict: chunk size -> MB/s.
+    """
+    workers = workers or DEFAULT_WORKERS
+    return {size: probe_throughput(encrypt_chunks_for(size), size, directory, probe_bytes)
+            for size in candidate_sizes(workers, budget, candidates)}
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(TUNING_CACHE_PATH, "r", encoding="utf-8") as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+def _save_cache():
+    try:
+        os.makedirs(os.path.dirname(TUNING_CACHE_PATH), exist_ok=True)
+        with open(TUNING_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(_cache, f, indent=2, sort_keys=True)
+    except OSError:
+        pass  # The cache only saves re-probing; tuning still works without it
+
+def tuned_chunk_size(label, encrypt_chunks_for, path, workers=None, refresh=False):
+    """
+    Return the fastest chunk size for label (a method name) on the device holding path.
+
+    The first call per (device, label, workers) probes each candidate and records the
+    winner in TUNING_CACHE_PATH; later calls, in this or any other process, reuse it.
+    """
+    workers = workers or DEFAULT_WORKERS
+    directory = os.path.dirname(os.path.abspath(path))
+    cache_key = f"{os.stat(directory).st_dev}:{label}:{workers}"
+    with _cache_lock:
+        cache = _load_cache()
+        if not refresh and cache_key in cache:
+            return cache[cache_key]
+        try:
+            results = probe_chunk_sizes(encrypt_chunks_for, directory, workers)
+        except OSError:
+            return CHUNK_SIZE
+        cache[cache_key] = max(results, key=results.get)
+        _save_cache()
+        return cache[cache_key]
+
+def _encrypt_chunks(encrypt_func, key, workers, chunks):
+    return (encrypted for _, encrypted in process_chunks(encrypt_func, key, chunks, workers))
+
+def tuned_chunk_size_for_func(encrypt_func, key, path, workers=None, refresh=False):
+    """tuned_chunk_size for an encrypt_file_in_chunks function such as encrypt_data_aes."""
+    label = getattr(encrypt_func, "__name__", None)
+    if isinstance(encrypt_func, partial):
+        label = encrypt_func.func.__name__ + "".join(f",{k}={v}" for k, v in sorted(encrypt_func.keywords.items()))
+    return tuned_chunk_size(label, lambda size: partial(_encrypt_chunks, encrypt_func, key, workers),
+                            path, workers, refresh)
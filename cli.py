@@ -0,0 +1,302 @@
+"""
+Headless SecureVault command line: securevault {encrypt,decrypt,verify,rewrap,wipe,keygen}.
+
+Only argparse is imported up front; each subcommand imports the modules it needs, so a
+scripted encrypt never loads PySide6, matplotlib or the wipe dependencies.
+Use "-" as a path to read from stdin or write to stdout (key-file mode only).
+"""
+import os
+import sys
+import argparse
+
+# Key bytes per method, for keygen and a clearer error than the cipher's own
+KEY_SIZES = {
+    "Fernet": 32,
+    "AES-128": 16,
+    "AES-192": 24,
+    "AES-256": 32,
+    "AES-256-GCM": 32,
+    "AES-256-GCM-STREAM": 32,
+    "ChaCha20-Poly1305-STREAM": 32,
+    "ChaCha20-Poly1305": 32,
+    "auto": 32,  # Faster of AES-256-GCM and ChaCha20-Poly1305 on this machine, recorded in the header
+}
+PASSWORD_METHODS = ("Fernet", "AES-128", "AES-192", "AES-256", "AES-256-GCM", "ChaCha20-Poly1305", "auto")
+KDF_CHOICES = ("PBKDF2-SHA256", "scrypt", "Argon2id")
+
+def _read_key(path):
+    from key_manager import load_fernet_key
+    key = load_fernet_key(path)
+    # Fernet keys are base64 text and may have gained a newline; raw AES keys must stay as they are
+    return key.strip() if len(key.strip()) == 44 else key
+
+def _key(args):
+    """Key from --key-file, a keyring key from --key-id, the whole keyring for --keyring, or None."""
+    if args.key_file:
+        return _read_key(args.key_file)
+    if getattr(args, "key_id", None) or getattr(args, "keyring", False):
+        from key_manager import KEYRING
+        return KEYRING.get(args.key_id) if getattr(args, "key_id", None) else KEYRING
+    return None
+
+def _read_password(args):
+    if args.password_env:
+        password = os.environ.get(args.password_env)
+        if password is None:
+            raise ValueError(f"Environment variable {args.password_env} is not set")
+        return password
+    import getpass
+    return getpass.getpass("Password: ")
+
+def _pipe(func, args, *func_args, **kwargs):
+    """Call func(readable, writable, ...) with "-" mapped to stdin/stdout."""
+    fin = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        fout = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            func(fin, fout, *func_args, **kwargs)
+        finally:
+            if fout is not sys.stdout.buffer:
+                fout.close()
+    finally:
+        if fin is not sys.stdin.buffer:
+            fin.close()
+
+def _progress(args):
+    """ProgressTracker printing a status line to stderr for --progress, otherwise None."""
+    if not getattr(args, "progress", False):
+        return None
+    from progress_visualization import ProgressTracker, format_progress
+    tracker = ProgressTracker()
+    tracker.set_callback(lambda processed, total: print(f"\r{format_progress(tracker.snapshot())}\033[K",
+                                                        end="", file=sys.stderr, flush=True))
+    return tracker
+
+def _finish_progress(tracker):
+    if tracker is not None:
+        tracker.finish()
+        print(file=sys.stderr)
+
+def _check_key(key, method):
+    if method != "Fernet" and len(key) != KEY_SIZES[method]:
+        raise ValueError(f"Key size ({len(key) * 8} bits) does not match {method}")
+
+def cmd_encrypt(args):
+    key = _key(args)
+    tracker = _progress(args)
+    if key is not None:
+        from container import CHUNK_SIZE, encrypt_container, encrypt_stream
+        if not args.envelope:
+            _check_key(key, args.method)
+        if args.input == "-" or args.output == "-":
+            chunk_size = args.chunk_size if isinstance(args.chunk_size, int) else CHUNK_SIZE  # No device to tune for
+            _pipe(encrypt_stream, args, key, args.method, chunk_size, tracker, workers=args.workers,
+                  compression=args.compression, envelope=args.envelope)
+        else:
+            encrypt_container(args.input, args.output, key, args.method, args.chunk_size, tracker, workers=args.workers,
+                              compression=args.compression, envelope=args.envelope)
+    else:
+        if "-" in (args.input, args.output):
+            raise ValueError("Password mode needs file paths; use --key-file to encrypt a pipe")
+        if args.method not in PASSWORD_METHODS:
+            raise ValueError(f"Password mode supports {', '.join(PASSWORD_METHODS)}")
+        from encryption import encrypt_file_with_password
+        encrypt_file_with_password(_read_password(args), args.input, args.output, args.method, tracker,
+                                   workers=args.workers, kdf=args.kdf)
+    _finish_progress(tracker)
+
+def cmd_decrypt(args):
+    key = _key(args)
+    tracker = _progress(args)
+    if key is not None:
+        from container import decrypt_container, decrypt_stream
+        if args.input == "-" or args.output == "-":
+            _pipe(decrypt_stream, args, key, tracker, workers=args.workers)
+        else:
+            decrypt_container(args.input, args.output, key, tracker, workers=args.workers)
+    else:
+        if "-" in (args.input, args.output):
+            raise ValueError("Password mode needs file paths; use --key-file to decrypt a pipe")
+        from encryption import decrypt_file_with_password
+        decrypt_file_with_password(_read_password(args), args.input, args.output, tracker, workers=args.workers)
+    _finish_progress(tracker)
+
+def cmd_verify(args):
+    from verify import VERIFY_ERRORS, describe_error, verify_file, verify_file_with_password, verify_tree
+    key = _key(args)
+    password = _read_password(args) if key is None else None
+    failed = 0
+    for path in args.paths:
+        if os.path.isdir(path):
+            if key is None:
+                raise ValueError("Verifying a directory needs --key-file")
+            results = verify_tree(path, key, args.method, args.workers)
+        else:
+            try:
+                if key is not None:
+                    results = [verify_file(path, key, args.method, args.workers)]
+                else:
+                    results = [verify_file_with_password(path, password, args.workers)]
+            except VERIFY_ERRORS as e:
+                results = [(path, False, 0, None, None, describe_error(e))]
+        for path_name, ok, chunks, bad_chunk, bad_offset, error in results:
+            if ok:
+                print(f"OK   {path_name} ({chunks} chunks)")
+            else:
+                failed += 1
+                where = f" chunk {bad_chunk} at offset {bad_offset}" if bad_offset is not None else ""
+                print(f"FAIL {path_name}{where}: {error}")
+    if failed:
+        raise RuntimeError(f"{failed} file(s) failed verification")
+
+def cmd_rewrap(args):
+    from batch import rewrap_tree
+    from container import rewrap
+    old_kek, new_kek = _read_key(args.old_key), _read_key(args.new_key)
+    errors = []
+    rewrapped = skipped = 0
+    for path in args.paths:
+        if os.path.isdir(path):
+            for rel_path, was_skipped, error in rewrap_tree(path, old_kek, new_kek):
+                if error:
+                    errors.append((os.path.join(path, rel_path), error))
+                elif was_skipped:  # Not written with envelope encryption; nothing to rotate
+                    skipped += 1
+                else:
+                    rewrapped += 1
+        else:
+            try:
+                rewrap(path, old_kek, new_kek)
+                rewrapped += 1
+            except Exception as e:
+                errors.append((path, str(e) or type(e).__name__))
+    for path, error in errors:
+        print(f"FAIL {path}: {error}", file=sys.stderr)
+    print(f"{rewrapped} rewrapped, {skipped} skipped without a wrapped key, {len(errors)} failed")
+    if errors:
+        raise RuntimeError(f"{len(errors)} file(s) could not be rewrapped")
+
+def cmd_wipe(args):
+    from secure_wipe import get_available_wipe_methods, wipe_drive
+    methods = get_available_wipe_methods()
+    if args.method not in methods:
+        raise ValueError(f"Unknown wipe method {args.method!r}; choose from: {', '.join(methods)}")
+    for path in args.paths:
+        wipe_drive(path, methods[args.method], direct_io=args.direct_io, allocated_only=args.allocated_only)
+
+def cmd_keygen(args):
+    from key_manager import generate_key
+    if args.method == "Fernet":
+        key = generate_key("Fernet")
+    else:
+        key = generate_key("AES", KEY_SIZES[args.method])
+    if args.keyring:
+        from key_manager import KEYRING
+        print(KEYRING.add(key, save=True))
+        if not args.output:
+            return
+    elif not args.output:
+        raise ValueError("Give an output file or --keyring")
+    if args.output == "-":
+        sys.stdout.buffer.write(key)
+        sys.stdout.buffer.flush()
+        return
+    fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+
+def _chunk_size(value):
+    return value if value == "auto" else int(value)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="securevault", description="SecureVault headless encryption and wiping")
+    parser.add_argument("--metrics-json", metavar="PATH", help="Write this run's metrics as JSON")
+    parser.add_argument("--metrics-textfile", metavar="PATH",
+                        help="Write this run's metrics in Prometheus text format (node_exporter textfile collector)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name, func, help_text in (("encrypt", cmd_encrypt, "Encrypt a file or stdin"),
+                                  ("decrypt", cmd_decrypt, "Decrypt a file or stdin")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("input", help='Input file, or "-" for stdin')
+        command.add_argument("output", help='Output file, or "-" for stdout')
+        command.add_argument("-k", "--key-file", help="Raw key file (from keygen); without a key a password is used")
+        if name == "encrypt":
+            command.add_argument("--key-id", help="Use this key from the keyring")
+        else:
+            command.add_argument("--keyring", action="store_true", help="Find the key by the ID in the file header")
+        command.add_argument("--password-env", metavar="VAR", help="Read the password from this environment variable")
+        command.add_argument("-w", "--workers", type=int, help="Parallel chunk workers")
+        command.add_argument("--progress", action="store_true", help="Show progress, throughput and ETA on stderr")
+        if name == "encrypt":
+            command.add_argument("-m", "--method", default="Fernet", choices=list(KEY_SIZES))
+            command.add_argument("-c", "--compression", choices=("auto", "zlib", "lzma", "zstd"),
+                                 help="Compress chunks before encrypting (key-file mode)")
+            command.add_argument("--envelope", action="store_true",
+                                 help="Treat the key file as a key-encryption key and wrap a per-file data key")
+            command.add_argument("--chunk-size", type=_chunk_size,
+                                 help='Plaintext bytes per chunk, or "auto" to use the tuned size (key-file mode)')
+            command.add_argument("--kdf", default="PBKDF2-SHA256", choices=KDF_CHOICES, help="Password mode KDF")
+        command.set_defaults(func=func)
+
+    command = commands.add_parser("verify", help="Check authentication tags without writing plaintext")
+    command.add_argument("paths", nargs="+", help="Encrypted files or directories")
+    command.add_argument("-k", "--key-file", help="Raw key file; without a key a password is used (files only)")
+    command.add_argument("--keyring", action="store_true", help="Find each file's key by the ID in its header")
+    command.add_argument("--password-env", metavar="VAR", help="Read the password from this environment variable")
+    command.add_argument("-m", "--method", choices=("Fernet", "AES-256-GCM", "ChaCha20-Poly1305"),
+                         help="Method of headerless chunked files")
+    command.add_argument("-w", "--workers", type=int, help="Parallel chunk workers")
+    command.set_defaults(func=cmd_verify)
+
+    command = commands.add_parser("rewrap", help="Rotate the key-encryption key of envelope containers in place")
+    command.add_argument("paths", nargs="+", help="Container files or directories")
+    command.add_argument("--old-key", required=True, help="Current key-encryption key file")
+    command.add_argument("--new-key", required=True, help="New key-encryption key file")
+    command.set_defaults(func=cmd_rewrap)
+
+    command = commands.add_parser("wipe", help="Securely wipe files, directories or drives")
+    command.add_argument("paths", nargs="+")
+    command.add_argument("-m", "--method", default="DoD 5220.22-M (3 Passes)", help="Wipe method name")
+    command.add_argument("--direct-io", action="store_true", help="Write with O_DIRECT, bypassing the page cache")
+    command.add_argument("--allocated-only", action="store_true",
+                         help="Overwrite only the allocated extents of sparse files, leaving holes unallocated; "
+                              "platforms without SEEK_DATA overwrite whole files")
+    command.set_defaults(func=cmd_wipe)
+
+    command = commands.add_parser("keygen", help="Generate a random key file")
+    command.add_argument("output", nargs="?", help='Key file to create (not overwritten), or "-" for stdout')
+    command.add_argument("-m", "--method", default="Fernet", choices=list(KEY_SIZES))
+    command.add_argument("--keyring", action="store_true", help="Also store the key in the keyring and print its ID")
+    command.set_defaults(func=cmd_keygen)
+    return parser
+
+def _write_metrics(args):
+    if not (args.metrics_json or args.metrics_textfile):
+        return
+    from metrics import REGISTRY
+    if args.metrics_json:
+        REGISTRY.write_json(args.metrics_json)
+    if args.metrics_textfile:
+        REGISTRY.write_textfile(args.metrics_textfile)
+
+def main(argv=None) -> int:
+    """Run the securevault command line and return the exit status."""
+    args = build_parser().parse_args(argv)
+    status = 0
+    try:
+        args.func(args)
+    except Exception as e:
+        from metrics import record_error
+        record_error(args.command, e)
+        print(f"securevault {args.command}: {str(e) or type(e).__name__}", file=sys.stderr)
+        status = 1
+    try:
+        _write_metrics(args)
+    except OSError as e:
+        print(f"securevault: cannot write metrics: {e}", file=sys.stderr)
+        status = status or 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import zlib
+from importlib.util import find_spec
+from encryption import measure_data_entropy
+
+# lzma and zstandard are imported where used, so containers written without them load neither
+ZSTD_AVAILABLE = find_spec("zstandard") is not None
+
+ENTROPY_THRESHOLD = 7.5  # Bits per byte; chunks above this are already compressed or encrypted
+ENTROPY_SAMPLE_SIZE = 4096  # Bytes sampled from each of the start, middle and end of a chunk
+
+# Codec name -> id stored in the record flags and in front of each compressed chunk's plaintext
+CODECS = {"none": 0, "zlib": 1, "lzma": 2, "zstd": 3}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODECS.items()}
+
+def default_codec():
+    """zstd when the zstandard package is installed, zlib otherwise."""
+    return "zstd" if ZSTD_AVAILABLE else "zlib"
+
+def estimate_entropy(data) -> float:
+    """Estimate the Shannon entropy of data in bits per byte from three small samples."""
+    if len(data) <= 3 * ENTROPY_SAMPLE_SIZE:
+        sample = bytes(data)
+    else:
+        middle = len(data) // 2
+        sample = b"".join((data[:ENTROPY_SAMPLE_SIZE], data[middle:middle + ENTROPY_SAMPLE_SIZE],
+                           data[-ENTROPY_SAMPLE_SIZE:]))
+    return measure_data_entropy(sample)
+
+def compress(data, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    elif codec == "lzma":
+        import lzma
+        return lzma.compress(data, preset=1)
+    elif codec == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd compression requires the zstandard package")
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+def decompress(data, codec_id: int) -> bytes:
+    codec = CODEC_NAMES.get(codec_id)
+    if codec == "none":
+        return bytes(data)
+    elif codec == "zlib":
+        return zlib.decompress(data)
+    elif codec == "lzma":
+        import lzma
+        return lzma.decompress(data)
+    elif codec == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd decompression requires the zstandard package")
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unsupported compression codec id: {codec_id}")
+
+def compress_chunk(data, codec: str):
+    """
+    Compress a chunk unless it looks incompressible or compression does not shrink it.
+
+    Returns:
+        tuple: (codec id actually used, payload)
+    """
+    if not data or estimate_entropy(data) > ENTROPY_THRESHOLD:
+        return CODECS["none"], data
+    compressed = compress(data, codec)
+    if len(compressed) >= len(data):
+        return CODECS["none"], data
+    return CODECS[codec], compressed
@@ -0,0 +1,681 @@
+import os
+import base64
+import struct
+from bisect import bisect_right
+from collections import namedtuple
+from functools import partial
+from encryption import (CHUNK_SIZE, TUNE_THRESHOLD, STREAM_NONCE_PREFIX_SIZE, STREAM_SALT_SIZE, process_chunks,
+                        encrypt_data_fernet, decrypt_data_fernet, encrypt_data_aes, decrypt_data_aes,
+                        encrypt_data_chacha20, decrypt_data_chacha20, StreamCipher, encrypt_chunk_stream,
+                        decrypt_chunk_stream, number_chunks, preferred_aead, timed_call)
+from compression import CODECS, compress_chunk, decompress, default_codec
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from io_hints import SPARSE_MIN_HOLE, data_extents
+from key_manager import KeyRing, generate_fernet_key, generate_key, key_id
+from metrics import BYTES_PROCESSED, CHUNK_SECONDS
+
+# SecureVault container format v2:
+#   header   magic, version, method id, flags, chunk size, extension length, extensions (TLV)
+#   records  [4-byte ciphertext length][1-byte record flags][ciphertext], closed by an empty END record;
+#            in sparse containers a hole record's ciphertext holds only the length of a run of zeros
+#   index    one entry per record: offset, ciphertext length, plaintext length, record flags
+#   footer   index offset, chunk count, footer magic
+MAGIC = b"SVC2"
+FOOTER_MAGIC = b"SVIX"
+FORMAT_VERSION = 2
+
+HEADER = struct.Struct(">4sBBBxIH")
+EXTENSION = struct.Struct(">BH")
+RECORD = struct.Struct(">IB")
+INDEX_ENTRY = struct.Struct(">QIIB")
+FOOTER = struct.Struct(">QI4s")
+
+RECORD_END = 0x80
+
+# Header flags
+FLAG_ARCHIVE = 0x01  # Plaintext is a packed multi-file archive (see archive.py)
+FLAG_COMPRESSED = 0x02  # Each chunk's plaintext starts with a compression codec id byte
+FLAG_SPARSE = 0x04  # As FLAG_COMPRESSED, and chunks may be hole records (codec HOLE_CODEC)
+
+# Record flags
+RECORD_CODEC_MASK = 0x07  # Compression codec id, mirrored from the encrypted codec byte for inspection
+
+# Codec id of hole records: the payload is the 8-byte length of a run of zeros that is not stored
+HOLE_CODEC = 7
+HOLE_RECORD_MAX = 1024 ** 3  # Longer holes are split, as index entries hold 4-byte plaintext lengths
+
+# Header extension types
+EXT_NONCE_PREFIX = 1
+EXT_WRAPPED_KEY = 2  # Per-file data key wrapped by a key-encryption key (envelope encryption)
+EXT_KEY_ID = 3  # key_manager.key_id of the key (the KEK for envelope containers), for keyring lookup
+EXT_STREAM_SALT = 4  # HKDF salt of the stream methods' per-file subkey (see encryption.derive_stream_key)
+# Extensions left out of the stream methods' AAD so rewrap can replace them in place
+UNAUTHENTICATED_EXTENSIONS = (EXT_WRAPPED_KEY, EXT_KEY_ID)
+
+# Wrapped data key: version, AES-GCM nonce, then the data key encrypted under the KEK with its tag.
+# Its length depends only on the method, so rewrap can overwrite it in place.
+WRAP_VERSION = 1
+WRAP_NONCE_SIZE = 12
+
+# Method name -> (method id, encrypt function, decrypt function)
+METHODS = {
+    "Fernet": (1, encrypt_data_fernet, decrypt_data_fernet),
+    "AES-128": (2, partial(encrypt_data_aes, mode="CFB"), partial(decrypt_data_aes, mode="CFB")),
+    "AES-192": (3, partial(encrypt_data_aes, mode="CFB"), partial(decrypt_data_aes, mode="CFB")),
+    "AES-256": (4, partial(encrypt_data_aes, mode="CFB"), partial(decrypt_data_aes, mode="CFB")),
+    "AES-256-GCM": (5, partial(encrypt_data_aes, mode="GCM"), partial(decrypt_data_aes, mode="GCM")),
+    "AES-256-GCM-STREAM": (6, encrypt_chunk_stream, decrypt_chunk_stream),
+    "ChaCha20-Poly1305-STREAM": (7, encrypt_chunk_stream, decrypt_chunk_stream),
+    "ChaCha20-Poly1305": (8, encrypt_data_chacha20, decrypt_data_chacha20),
+}
+# Raw key bytes for the AES and AEAD methods (Fernet keys come from generate_fernet_key)
+METHOD_KEY_SIZES = {"AES-128": 16, "AES-192": 24, "AES-256": 32, "AES-256-GCM": 32,
+                    "AES-256-GCM-STREAM": 32, "ChaCha20-Poly1305-STREAM": 32, "ChaCha20-Poly1305": 32}
+METHOD_NAMES = {method_id: name for name, (method_id, _, _) in METHODS.items()}
+
+# Streaming AEAD methods: one cipher context per file, nonce = prefix + counter + last flag
+STREAM_METHODS = {"AES-256-GCM-STREAM": "AES-256-GCM", "ChaCha20-Poly1305-STREAM": "ChaCha20-Poly1305"}
+
+def resolve_method(method):
+    """Concrete method for "auto": the stream variant of the faster AEAD (see preferred_aead)."""
+    if method == "auto":
+        return preferred_aead() + "-STREAM"
+    return method
+
+ContainerHeader = namedtuple("ContainerHeader", "version method flags chunk_size extensions data_offset raw")
+IndexEntry = namedtuple("IndexEntry", "offset length plain_offset plain_length flags")
+
+def pack_header(method, chunk_size, flags=0, extensions=None):
+    """Build a v2 header; extensions maps a 1-byte type to a bytes value."""
+    if method not in METHODS:
+        raise ValueError(f"Unsupported container method: {method}")
+    ext = b"".join(EXTENSION.pack(ext_type, len(value)) + value
+                   for ext_type, value in sorted((extensions or {}).items()))
+    return HEADER.pack(MAGIC, FORMAT_VERSION, METHODS[method][0], flags, chunk_size, len(ext)) + ext
+
+def read_header(fin):
+    """Read and parse the v2 header at the current position (the start) of an open file; no seeking."""
+    fixed = fin.read(HEADER.size)
+    if len(fixed) < HEADER.size:
+        raise ValueError("Invalid file format or not a SecureVault container")
+    magic, version, method_id, flags, chunk_size, ext_len = HEADER.unpack(fixed)
+    if magic != MAGIC:
+        raise ValueError("Invalid file format or not a SecureVault container")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported container version: {version}")
+    if method_id not in METHOD_NAMES:
+        raise ValueError("Unsupported method in file header")
+    ext = fin.read(ext_len)
+    if len(ext) < ext_len:
+        raise ValueError("Truncated container header")
+    extensions = {}
+    pos = 0
+    while pos < ext_len:
+        ext_type, length = EXTENSION.unpack_from(ext, pos)
+        pos += EXTENSION.size
+        extensions[ext_type] = ext[pos:pos + length]
+        pos += length
+    return ContainerHeader(version, METHOD_NAMES[method_id], flags, chunk_size, extensions,
+                           HEADER.size + ext_len, fixed + ext)
+
+def container_key_id(path):
+    """Hex key ID recorded in a container's header, or None for other files and older containers."""
+    with open(path, "rb") as fin:
+        if fin.read(len(MAGIC)) != MAGIC:
+            return None
+        fin.seek(0)
+        kid = read_header(fin).extensions.get(EXT_KEY_ID)
+    return kid.hex() if kid else None
+
+def is_container(path):
+    """Return True if the file starts with the v2 container magic."""
+    with open(path, "rb") as fin:
+        return fin.read(len(MAGIC)) == MAGIC
+
+def read_index(fin):
+    """Read the chunk index from the trailer of an open container file."""
+    fin.seek(0, os.SEEK_END)
+    end = fin.tell()
+    if end < FOOTER.size:
+        raise ValueError("Container is missing its index footer")
+    fin.seek(end - FOOTER.size)
+    index_offset, count, magic = FOOTER.unpack(fin.read(FOOTER.size))
+    if magic != FOOTER_MAGIC or index_offset + count * INDEX_ENTRY.size != end - FOOTER.size:
+        raise ValueError("Container is missing its index footer")
+    fin.seek(index_offset)
+    raw = fin.read(count * INDEX_ENTRY.size)
+    entries = []
+    plain_offset = 0
+    for offset, length, plain_length, flags in INDEX_ENTRY.iter_unpack(raw):
+        entries.append(IndexEntry(offset, length, plain_offset, plain_length, flags))
+        plain_offset += plain_length
+    return entries
+
+def header_aad(method, chunk_size, flags, extensions):
+    """
+    Header bytes authenticated by the stream methods.
+
+    The wrapped data key and key ID are left out so that rewrap can replace them without
+    touching any chunk; for containers without them this is exactly the header as written.
+    """
+    return pack_header(method, chunk_size, flags, {ext_type: value for ext_type, value in extensions.items()
+                                                   if ext_type not in UNAUTHENTICATED_EXTENSIONS})
+
+def _kek_bytes(kek):
+    """AES-GCM key for a key-encryption key: raw 16/24/32 bytes, or a Fernet key from generate_key."""
+    if len(kek) == 44:
+        kek = base64.urlsafe_b64decode(kek)
+    if len(kek) not in (16, 24, 32):
+        raise ValueError("Key-encryption key must be a Fernet key or 16, 24 or 32 raw bytes")
+    return kek
+
+def _wrap_aad(method):
+    return MAGIC + bytes([METHODS[method][0]])
+
+def wrap_data_key(kek, data_key, method):
+    """Encrypt a data key under kek for the EXT_WRAPPED_KEY header field."""
+    nonce = os.urandom(WRAP_NONCE_SIZE)
+    return bytes([WRAP_VERSION]) + nonce + AESGCM(_kek_bytes(kek)).encrypt(nonce, data_key, _wrap_aad(method))
+
+def unwrap_data_key(kek, wrapped, method):
+    """Recover the data key from an EXT_WRAPPED_KEY field; raises InvalidTag for the wrong kek."""
+    if not wrapped or wrapped[0] != WRAP_VERSION:
+        raise ValueError("Unsupported wrapped key version")
+    nonce = wrapped[1:1 + WRAP_NONCE_SIZE]
+    return AESGCM(_kek_bytes(kek)).decrypt(nonce, wrapped[1 + WRAP_NONCE_SIZE:], _wrap_aad(method))
+
+def new_data_key(method):
+    """Random per-file data key for method."""
+    return generate_key("Fernet") if method == "Fernet" else generate_key("AES", METHOD_KEY_SIZES[method])
+
+def resolve_key(header, key):
+    """Return key itself, or the key a KeyRing holds for the header's key ID."""
+    if not isinstance(key, KeyRing):
+        return key
+    kid = header.extensions.get(EXT_KEY_ID)
+    if kid is None:
+        raise ValueError("Container has no key ID; pass its key explicitly")
+    return key.get(kid)
+
+def _chunk_key(header, key):
+    """
+    Return what process_chunks passes as the key: a StreamCipher bound to the header for stream
+    methods. key may be a KeyRing. For envelope containers key is the KEK and the data key is
+    unwrapped first.
+    """
+    key = resolve_key(header, key)
+    if EXT_WRAPPED_KEY in header.extensions:
+        key = unwrap_data_key(key, header.extensions[EXT_WRAPPED_KEY], header.method)
+    if header.method not in STREAM_METHODS:
+        return key
+    prefix = header.extensions.get(EXT_NONCE_PREFIX)
+    if prefix is None:
+        raise ValueError("Stream container is missing its nonce prefix")
+    aad = header_aad(header.method, header.chunk_size, header.flags, header.extensions)
+    return StreamCipher(STREAM_METHODS[header.method], key, prefix, aad, header.extensions.get(EXT_STREAM_SALT))
+
+class Hole:
+    """A run of length zero bytes that a sparse container records without encrypting it."""
+    __slots__ = ("length",)
+
+    def __init__(self, length):
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+def _holes(length):
+    while length > 0:
+        yield Hole(min(length, HOLE_RECORD_MAX))
+        length -= HOLE_RECORD_MAX
+
+def sparse_chunks(fin, chunk_size, extents, size):
+    """
+    Yield chunk_size plaintext chunks from the data extents of an open file (see
+    io_hints.data_extents) and Hole objects for the gaps, so holes are never read.
+    """
+    position = 0
+    for offset, length in extents:
+        yield from _holes(offset - position)
+        fin.seek(offset)
+        end = offset + length
+        while offset < end:
+            chunk = fin.read(min(chunk_size, end - offset))
+            if not chunk:
+                raise ValueError("File shrank while it was being encrypted")
+            offset += len(chunk)
+            yield chunk
+        position = end
+    yield from _holes(size - position)
+
+def _zeros(length, chunk_size=CHUNK_SIZE):
+    """A hole as plaintext chunks, for outputs that cannot seek."""
+    while length > 0:
+        yield bytes(min(length, chunk_size))
+        length -= chunk_size
+
+def _plain(chunk):
+    """Plaintext or ciphertext bytes of a chunk, which is an (index, last, data) tuple for stream methods."""
+    return chunk[2] if isinstance(chunk, tuple) else chunk
+
+def _with_data(chunk, data):
+    return (chunk[0], chunk[1], data) if isinstance(chunk, tuple) else data
+
+def _compress_encrypt(context, chunk):
+    """
+    process_chunks function for compressed containers: context is (encrypt function, key, codec).
+
+    The codec id is encrypted in front of the payload, so flipping the unauthenticated
+    record flag cannot make a chunk decompress differently. codec None stores chunks
+    uncompressed (sparse containers), and a Hole is stored as HOLE_CODEC and its length.
+    """
+    encrypt_func, key, codec = context
+    data = _plain(chunk)
+    if isinstance(data, Hole):
+        codec_id, payload = HOLE_CODEC, data.length.to_bytes(8, "big")
+    elif codec is None:
+        codec_id, payload = CODECS["none"], data
+    else:
+        codec_id, payload = compress_chunk(data, codec)
+    return codec_id, encrypt_func(key, _with_data(chunk, bytes([codec_id]) + payload))
+
+def _decrypt_decompress(context, chunk):
+    """Inverse of _compress_encrypt: context is (decrypt function, key); hole records return a Hole."""
+    decrypt_func, key = context
+    plaintext = decrypt_func(key, chunk)
+    if not plaintext:
+        raise ValueError("Compressed chunk is missing its codec byte")
+    if plaintext[0] == HOLE_CODEC:
+        if len(plaintext) != 9:
+            raise ValueError("Malformed hole record")
+        return Hole(int.from_bytes(plaintext[1:], "big"))
+    return decompress(memoryview(plaintext)[1:], plaintext[0])
+
+def chunk_decryptor(header, key):
+    """Return (function, key argument) for process_chunks to decrypt this container's records."""
+    decrypt_func = METHODS[header.method][2]
+    chunk_key = _chunk_key(header, key)
+    if header.flags & (FLAG_COMPRESSED | FLAG_SPARSE):
+        return _decrypt_decompress, (decrypt_func, chunk_key)
+    return decrypt_func, chunk_key
+
+def _read_records(fin):
+    while True:
+        record = fin.read(RECORD.size)
+        if len(record) < RECORD.size:
+            raise ValueError("Truncated container: missing END record")
+        length, flags = RECORD.unpack(record)
+        if flags & RECORD_END:
+            break
+        data = fin.read(length)
+        if len(data) < length:
+            raise ValueError("Truncated chunk in encrypted file")
+        yield data
+
+def rechunk(blocks, chunk_size):
+    """Regroup an iterable of byte blocks of any size into chunk_size pieces (the last may be shorter)."""
+    pending = bytearray()
+    for block in blocks:
+        pending += block
+        while len(pending) >= chunk_size:
+            yield bytes(pending[:chunk_size])
+            del pending[:chunk_size]
+    if pending:
+        yield bytes(pending)
+
+def encrypt_iter(chunks, key, method="Fernet", chunk_size=CHUNK_SIZE, workers=None,
+                 use_processes=False, extensions=None, flags=0, progress=None, compression=None, envelope=False,
+                 sparse=False, record_metrics=True):
+    """
+    Encrypt an iterable of plaintext chunks and yield the v2 container as byte blocks.
+
+    chunks should be chunk_size bytes each (see rechunk); nothing needs to know the total size.
+    progress, if given, is called with the plaintext bytes so far. compression ("zlib", "lzma",
+    "zstd" or "auto") compresses each chunk before encryption unless its estimated entropy says
+    it is already compressed or random. With envelope=True, key is a key-encryption key: the
+    chunks are encrypted under a random data key that is stored wrapped in the header.
+    The header records key_id(key), so a KeyRing can find the key when decrypting, and the
+    concrete method when method is "auto". With sparse=True chunks may include Hole objects
+    (see sparse_chunks), which are written as hole records instead of encrypted zeros.
+    record_metrics=False keeps the run out of the metrics registry, for chunk_tuner's probes.
+    """
+    method = resolve_method(method)
+    extensions = dict(extensions or {})
+    extensions[EXT_KEY_ID] = key_id(key)
+    if method in STREAM_METHODS:
+        extensions[EXT_NONCE_PREFIX] = os.urandom(STREAM_NONCE_PREFIX_SIZE)
+        extensions[EXT_STREAM_SALT] = os.urandom(STREAM_SALT_SIZE)
+    if envelope:
+        data_key = new_data_key(method)
+        extensions[EXT_WRAPPED_KEY] = wrap_data_key(key, data_key, method)
+        key = data_key
+    if compression:
+        flags |= FLAG_COMPRESSED
+    if sparse:
+        flags |= FLAG_SPARSE
+    header = pack_header(method, chunk_size, flags, extensions)
+    encrypt_func = METHODS[method][1]
+    chunk_key = key
+    if method in STREAM_METHODS:
+        chunk_key = StreamCipher(STREAM_METHODS[method], key, extensions[EXT_NONCE_PREFIX],
+                                 header_aad(method, chunk_size, flags, extensions), extensions[EXT_STREAM_SALT])
+        chunks = number_chunks(chunks)
+        use_processes = False  # The AEAD context cannot be pickled
+    if compression or sparse:
+        codec = default_codec() if compression == "auto" else compression
+        encrypt_func, chunk_key = _compress_encrypt, (encrypt_func, chunk_key, codec)
+    processed = 0
+    index = []
+
+    yield header
+    offset = len(header)
+    for chunk, (elapsed, encrypted) in process_chunks(partial(timed_call, encrypt_func), chunk_key, chunks, workers,
+                                                      use_processes=use_processes):
+        size = len(_plain(chunk))
+        if record_metrics:
+            CHUNK_SECONDS.observe(elapsed, operation="encrypt")
+            if not isinstance(_plain(chunk), Hole):
+                BYTES_PROCESSED.inc(size, operation="encrypt")
+        record_flags = 0
+        if compression or sparse:
+            record_flags, encrypted = encrypted
+        yield RECORD.pack(len(encrypted), record_flags)
+        yield encrypted
+        index.append(INDEX_ENTRY.pack(offset, len(encrypted), size, record_flags))
+        offset += RECORD.size + len(encrypted)
+        processed += size
+        if progress:
+            progress(processed)
+    yield RECORD.pack(0, RECORD_END)
+    index_offset = offset + RECORD.size
+    yield b"".join(index) + FOOTER.pack(index_offset, len(index), FOOTER_MAGIC)
+
+def write_container(fout, chunks, key, method="Fernet", chunk_size=CHUNK_SIZE, workers=None,
+                    use_processes=False, extensions=None, flags=0, progress=None, compression=None, envelope=False,
+                    sparse=False):
+    """
+    Encrypt an iterable of plaintext chunks into an open binary file as a v2 container.
+
+    fout is only written to sequentially, so it may be a pipe. Arguments are as for encrypt_iter.
+    """
+    for block in encrypt_iter(chunks, key, method, chunk_size, workers, use_processes, extensions,
+                              flags, progress, compression, envelope, sparse):
+        fout.write(block)
+
+class _IterReader:
+    """Minimal file-like read(n) over an iterable of byte blocks."""
+    def __init__(self, blocks):
+        self._blocks = iter(blocks)
+        self._pending = bytearray()
+
+    def read(self, size):
+        while len(self._pending) < size:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            self._pending += block
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+def decrypt_iter(blocks, key, workers=None, progress=None):
+    """
+    Decrypt a v2 container given as an iterable of byte blocks, yielding plaintext chunks.
+
+    Records are consumed in order up to the END record; the index trailer is not needed.
+    progress, if given, is called with the plaintext bytes so far. Holes come out as zeros.
+    """
+    fin = _IterReader(blocks)
+    header = read_header(fin)
+    decrypt_func, chunk_key = chunk_decryptor(header, key)
+    records = _read_records(fin)
+    if header.method in STREAM_METHODS:
+        records = number_chunks(records)
+    processed = 0
+    for record, (elapsed, decrypted) in process_chunks(partial(timed_call, decrypt_func), chunk_key, records, workers):
+        CHUNK_SECONDS.observe(elapsed, operation="decrypt")
+        BYTES_PROCESSED.inc(len(_plain(record)), operation="decrypt")
+        processed += len(decrypted)
+        if progress:
+            progress(processed)
+        if isinstance(decrypted, Hole):
+            yield from _zeros(len(decrypted), header.chunk_size)
+        else:
+            yield decrypted
+
+def _stream_progress(progress_tracker):
+    if progress_tracker is None:
+        return None
+    return lambda processed: progress_tracker.update_progress(processed, 0)  # 0: total size unknown
+
+def encrypt_stream(readable, writable, key, method="Fernet", chunk_size=CHUNK_SIZE, progress_tracker=None,
+                   workers=None, compression=None, envelope=False):
+    """
+    Encrypt everything read from readable (e.g. sys.stdin.buffer) into writable as a v2 container.
+
+    Neither side needs to be seekable or have a known size, so pipes work without temp files.
+    progress_tracker receives (plaintext bytes so far, 0) because the total is unknown.
+
+    Returns:
+        int: Plaintext bytes encrypted.
+    """
+    processed = 0
+    tracker_progress = _stream_progress(progress_tracker)
+
+    def progress(count):
+        nonlocal processed
+        processed = count
+        if tracker_progress:
+            tracker_progress(count)
+
+    chunks = rechunk(iter(lambda: readable.read(chunk_size), b""), chunk_size)
+    write_container(writable, chunks, key, method, chunk_size, workers, progress=progress, compression=compression,
+                    envelope=envelope)
+    writable.flush()
+    return processed
+
+def decrypt_stream(readable, writable, key, progress_tracker=None, workers=None):
+    """
+    Decrypt a v2 container read from readable into writable without seeking either.
+
+    Returns:
+        int: Plaintext bytes written.
+    """
+    processed = 0
+    blocks = iter(lambda: readable.read(CHUNK_SIZE), b"")
+    for plaintext in decrypt_iter(blocks, key, workers, _stream_progress(progress_tracker)):
+        writable.write(plaintext)
+        processed += len(plaintext)
+    writable.flush()
+    return processed
+
+def tuned_container_chunk_size(method, path, workers=None, refresh=False):
+    """Fastest chunk size for method on the device holding path (see chunk_tuner.tuned_chunk_size)."""
+    from chunk_tuner import tuned_chunk_size
+    key = generate_fernet_key() if method == "Fernet" else os.urandom(METHOD_KEY_SIZES[method])
+    # Probes are not jobs, so they stay out of the metrics registry
+    return tuned_chunk_size(method, lambda size: partial(encrypt_iter, key=key, method=method, chunk_size=size,
+                                                         workers=workers, record_metrics=False),
+                            path, workers, refresh)
+
+def encrypt_container(in_path, out_path, key, method="Fernet", chunk_size=None, progress_tracker=None,
+                      workers=None, use_processes=False, extensions=None, compression=None, envelope=False,
+                      sparse=None):
+    """
+    Encrypt a file into a seekable v2 container.
+
+    Args:
+        in_path (str): Plaintext file.
+        out_path (str): Container file to create.
+        key (bytes): Key for the selected method.
+        method (str): One of METHODS, or "auto" for the faster stream AEAD on this machine.
+        chunk_size (int): Plaintext bytes per record, recorded in the header; "auto" uses the size
+            chunk_tuner measured for method on out_path's device, and None does so for files of
+            TUNE_THRESHOLD bytes and above (CHUNK_SIZE otherwise).
+        progress_tracker (ProgressTracker): Optional progress tracker.
+        workers (int): Worker count for process_chunks.
+        use_processes (bool): Use a process pool instead of threads.
+        extensions (dict): Extra header fields, type -> bytes.
+        compression (str): Optional per-chunk compression codec (see write_container).
+        envelope (bool): Treat key as a key-encryption key and store a wrapped per-file data key
+            in the header, so the key can later be rotated with rewrap.
+        sparse (bool): Find holes with SEEK_DATA/SEEK_HOLE and store them as hole records, so
+            only the allocated data is read and encrypted. None does so when the file has holes
+            of at least SPARSE_MIN_HOLE bytes.
+    """
+    file_size = os.path.getsize(in_path)
+    method = resolve_method(method)
+    if chunk_size is None:
+        chunk_size = "auto" if file_size >= TUNE_THRESHOLD else CHUNK_SIZE
+    if chunk_size == "auto":
+        chunk_size = tuned_container_chunk_size(method, out_path, workers)
+    progress = None
+    if progress_tracker:
+        progress = lambda processed: progress_tracker.update_progress(processed, file_size)
+    with open(in_path, "rb") as fin, open(out_path, "wb") as fout:
+        extents = data_extents(fin.fileno(), file_size, SPARSE_MIN_HOLE) if sparse is not False else None
+        if sparse is None:
+            sparse = extents != ([(0, file_size)] if file_size else [])
+        if sparse:
+            chunks = sparse_chunks(fin, chunk_size, extents, file_size)
+        else:
+            fin.seek(0)
+            chunks = iter(partial(fin.read, chunk_size), b"")
+        write_container(fout, chunks, key, method, chunk_size, workers, use_processes, extensions,
+                        progress=progress, compression=compression, envelope=envelope, sparse=sparse)
+
+def decrypt_container(in_path, out_path, key, progress_tracker=None, workers=None, use_processes=False):
+    """
+    Decrypt a whole v2 container sequentially; the index trailer is not needed.
+
+    Hole records are skipped over in the output, so a sparse input comes back sparse. If any
+    record fails to decrypt the output is left empty.
+    """
+    file_size = os.path.getsize(in_path)
+    with open(in_path, "rb") as fin, open(out_path, "wb") as fout:
+        header = read_header(fin)
+        decrypt_func, chunk_key = chunk_decryptor(header, key)
+        processed = header.data_offset
+        records = _read_records(fin)
+        if header.method in STREAM_METHODS:
+            records = number_chunks(records)
+            use_processes = False
+        try:
+            for record, (elapsed, decrypted) in process_chunks(partial(timed_call, decrypt_func), chunk_key, records,
+                                                               workers, use_processes=use_processes):
+                CHUNK_SECONDS.observe(elapsed, operation="decrypt")
+                BYTES_PROCESSED.inc(len(_plain(record)), operation="decrypt")
+                if isinstance(decrypted, Hole):
+                    fout.seek(len(decrypted), os.SEEK_CUR)
+                else:
+                    fout.write(decrypted)
+                processed += RECORD.size + len(_plain(record))
+                if progress_tracker:
+                    progress_tracker.update_progress(processed, file_size)
+        except BaseException:
+            fout.truncate(0)  # A chunk failed authentication or the container is damaged: keep no plaintext
+            raise
+        fout.truncate()  # Sets the size when the file ends in a hole
+
+def _extension_offset(header, ext_type):
+    """File offset of an extension's value, found by walking the TLV list after the fixed header."""
+    pos = HEADER.size
+    while pos < header.data_offset:
+        current, length = EXTENSION.unpack_from(header.raw, pos)
+        pos += EXTENSION.size
+        if current == ext_type:
+            return pos
+        pos += length
+    raise ValueError("Container has no such header extension")
+
+def rewrap(path, old_kek, new_kek):
+    """
+    Rotate the key-encryption key of an envelope container in place.
+
+    Only the wrapped data key and key ID in the header are rewritten (a few dozen bytes); the
+    chunks, which are encrypted under the unchanged data key, are not read or written.
+    old_kek may be a KeyRing.
+    """
+    with open(path, "r+b") as f:
+        header = read_header(f)
+        wrapped = header.extensions.get(EXT_WRAPPED_KEY)
+        if wrapped is None:
+            raise ValueError("Container was not written with envelope encryption")
+        data_key = unwrap_data_key(resolve_key(header, old_kek), wrapped, header.method)
+        rewrapped = wrap_data_key(new_kek, data_key, header.method)
+        if len(rewrapped) != len(wrapped):
+            raise ValueError("Wrapped key length changed; cannot rewrap in place")
+        f.seek(_extension_offset(header, EXT_WRAPPED_KEY))
+        f.write(rewrapped)
+        if EXT_KEY_ID in header.extensions:
+            f.seek(_extension_offset(header, EXT_KEY_ID))
+            f.write(key_id(new_kek))
+        f.flush()
+        os.fsync(f.fileno())
+
+class ContainerReader:
+    """
+    Random-access reader over an open v2 container.
+
+    The header and index are read once; the most recently decrypted chunk is kept so that
+    consecutive small reads from the same chunk decrypt it only once.
+    """
+    def __init__(self, fin, key):
+        self.fin = fin
+        self.header = read_header(fin)
+        self.index = read_index(fin)
+        self.size = self.index[-1].plain_offset + self.index[-1].plain_length if self.index else 0
+        self._decrypt_func, self._chunk_key = chunk_decryptor(self.header, key)
+        self._starts = [entry.plain_offset for entry in self.index]
+        self._cached = (None, None)  # (chunk position, plaintext)
+
+    def read_chunk(self, position):
+        """Decrypt and return the plaintext of chunk number position, or a Hole for a hole record."""
+        if self._cached[0] == position:
+            return self._cached[1]
+        entry = self.index[position]
+        self.fin.seek(entry.offset + RECORD.size)
+        ciphertext = self.fin.read(entry.length)
+        if self.header.method in STREAM_METHODS:
+            ciphertext = (position, position == len(self.index) - 1, ciphertext)
+        plaintext = self._decrypt_func(self._chunk_key, ciphertext)
+        self._cached = (position, plaintext)
+        return plaintext
+
+    def read(self, offset, length):
+        """Return plaintext bytes [offset, offset + length), shorter if the range passes the end."""
+        if offset < 0 or length < 0:
+            raise ValueError("Offset and length must be non-negative")
+        end = min(offset + length, self.size)
+        parts = []
+        position = max(0, bisect_right(self._starts, offset) - 1)
+        while offset < end:
+            entry = self.index[position]
+            plaintext = self.read_chunk(position)
+            start = offset - entry.plain_offset
+            if isinstance(plaintext, Hole):
+                part = bytes(max(0, min(end - entry.plain_offset, len(plaintext)) - start))
+            else:
+                part = plaintext[start:end - entry.plain_offset]
+            if not part:
+                raise ValueError("Chunk is shorter than its index entry")
+            parts.append(part)
+            offset += len(part)
+            position += 1
+        return b"".join(parts)
+
+def decrypt_range(path, offset, length, key):
+    """
+    Decrypt only the chunks that cover plaintext bytes [offset, offset + length).
+
+    Args:
+        path (str): Container file.
+        offset (int): First plaintext byte to return.
+        length (int): Number of plaintext bytes to return.
+        key (bytes): Key for the container's method.
+
+    Returns:
+        bytes: The requested plaintext, shorter than length if the range passes the end of the file.
+    """
+    with open(path, "rb") as fin:
+        return ContainerReader(fin, key).read(offset, length)
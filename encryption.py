@@ -1,25 +1,118 @@
 import os
 import math
+import mmap
+import base64
+import queue
+import struct
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
 from cryptography.hazmat.primitives import hashes
-import psutil
+from importlib.util import find_spec
+from key_manager import KEY_CACHE
+from metrics import BYTES_PROCESSED, CHUNK_SECONDS, KDF_SECONDS, STAGE_BUSY_SECONDS, STAGE_IDLE_SECONDS
+from io_hints import DROP_CACHE_THRESHOLD, DropBehind, advise_sequential, drop_cache as drop_file_cache, preallocate as preallocate_file
+
+# NumPy, psutil and the process pool are imported where used: loading them up front costs
+# more than the rest of the CLI's start-up put together.
+NUMPY_AVAILABLE = find_spec("numpy") is not None
+
+try:
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+    ARGON2_AVAILABLE = True
+except ImportError:  # cryptography < 44
+    ARGON2_AVAILABLE = False
 
 CHUNK_SIZE = 1024 * 1024  # 1MB default, adjustable
+DEFAULT_WORKERS = os.cpu_count() or 1
+IN_FLIGHT_PER_WORKER = 2  # Chunks queued per worker; bounds memory to workers * 2 * CHUNK_SIZE
+MMAP_THRESHOLD = 1024 ** 3  # Files of 1GB and above are encrypted through mmap when the filesystem allows it
+PIPELINE_QUEUE_DEPTH = 4  # Chunks queued between the reader, crypto and writer stages
+TUNE_THRESHOLD = 64 * 1024 * 1024  # Files this big use the chunk size chunk_tuner measured for the device
+MAX_TUNED_CHUNK_SIZE = 16 * 1024 * 1024  # Largest chunk size chunk_tuner picks
+AES_BLOCK_SIZE = 16
+HISTOGRAM_BLOCK_SIZE = 64 * 1024
+PBKDF2_ITERATIONS = 100000  # Strong iteration count for security
+KDF_TARGET_SECONDS = 0.25  # Default unlock latency for calibrate_kdf
+# KDF name -> (header id, default cost parameters)
+KDF_DEFAULTS = {
+    "PBKDF2-SHA256": (1, {"iterations": PBKDF2_ITERATIONS}),
+    "scrypt": (2, {"n": 2 ** 15, "r": 8, "p": 1}),
+    "Argon2id": (3, {"iterations": 3, "memory_cost": 64 * 1024, "lanes": 4}),  # memory_cost in KiB
+}
+KDF_NAMES = {kdf_id: name for name, (kdf_id, _) in KDF_DEFAULTS.items()}
+# Lowest costs calibrate_kdf will choose, whatever the latency target
+KDF_MINIMUMS = {
+    "PBKDF2-SHA256": {"iterations": 10000},
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+    "Argon2id": {"iterations": 1, "memory_cost": 8 * 1024, "lanes": 1},
+}
+# Highest costs accepted from a password header, which is not authenticated: a crafted file
+# must not be able to make decryption run for minutes or allocate gigabytes. Besides these
+# per-field caps, scrypt and Argon2id memory is held to KDF_MAX_MEMORY and memory times
+# passes to KDF_MAX_WORK.
+KDF_MAXIMUMS = {
+    "PBKDF2-SHA256": {"iterations": 10000000},
+    "scrypt": {"n": 2 ** 22, "r": 8, "p": 4},
+    "Argon2id": {"iterations": 64, "memory_cost": 1024 * 1024, "lanes": 64},
+}
+KDF_MAX_MEMORY = 1024 ** 3  # Bytes one scrypt or Argon2id derivation may use
+KDF_MAX_WORK = 4 * 1024 ** 3  # Memory times passes (scrypt p, Argon2id iterations)
+KDF_CALIBRATION_PATH = os.path.join(os.path.expanduser("~"), ".securevault", "kdf.json")
+STREAM_NONCE_PREFIX_SIZE = 7  # 7-byte prefix + 4-byte counter + 1-byte last flag = 12-byte nonce
+STREAM_SALT_SIZE = 32  # Per-file HKDF salt; each file is sealed under its own subkey
+AEAD_ALGORITHMS = {"AES-256-GCM": AESGCM, "ChaCha20-Poly1305": ChaCha20Poly1305}
+AEAD_NONCE_SIZE = 12
+AEAD_BENCHMARK_SIZE = 1024 * 1024
+AEAD_BENCHMARK_ROUNDS = 8
+AEAD_CHOICE_PATH = os.path.join(os.path.expanduser("~"), ".securevault", "aead.json")
+
+def byte_histogram(data):
+    """Count occurrences of each byte value; a NumPy bincount when NumPy is installed."""
+    if NUMPY_AVAILABLE:
+        import numpy as np
+        values = np.frombuffer(data, dtype=np.uint8)
+        counts = np.zeros(256, dtype=np.int64)
+        # bincount widens its input to intp; cache-sized blocks keep that copy out of main memory
+        for start in range(0, len(values), HISTOGRAM_BLOCK_SIZE):
+            counts += np.bincount(values[start:start + HISTOGRAM_BLOCK_SIZE], minlength=256)
+        return counts
+    counts = [0] * 256
+    for value, count in Counter(bytes(data)).items():
+        counts[value] = count
+    return counts
+
+def histogram_entropy(counts) -> float:
+    """Shannon entropy in bits per byte of a 256-entry byte histogram."""
+    if NUMPY_AVAILABLE:
+        import numpy as np
+        counts = np.asarray(counts, dtype=np.float64)
+        total = counts.sum()
+        if not total:
+            return 0.0
+        p = counts[counts > 0] / total
+        return float(-(p * np.log2(p)).sum())
+    total = sum(counts)
+    if not total:
+        return 0.0
+    return -sum(count / total * math.log2(count / total) for count in counts if count)
+
+def measure_data_entropy(data) -> float:
+    """Shannon entropy of data in bits per byte (0.0 to 8.0)."""
+    return histogram_entropy(byte_histogram(data)) if len(data) else 0.0
 
 def measure_data_perplexity(data: bytes) -> float:
     if not data:
         return 0.0
-    freq = {}
-    for byte in data:
-        freq[byte] = freq.get(byte, 0) + 1
-    total = len(data)
-    entropy = 0.0
-    for count in freq.values():
-        p = count / total
-        entropy -= p * math.log2(p)
-    return 2 ** entropy
+    return 2 ** measure_data_entropy(data)
 
 def encrypt_data_fernet(key: bytes, data: bytes) -> bytes:
     return Fernet(key).encrypt(data)
@@ -27,117 +120,1190 @@ def encrypt_data_fernet(key: bytes, data: bytes) -> bytes:
 def decrypt_data_fernet(key: bytes, data: bytes) -> bytes:
     return Fernet(key).decrypt(data)
 
-def encrypt_data_aes(key: bytes, data: bytes, mode: str = "CFB") -> bytes:
-    iv = os.urandom(16)
+def encrypt_data_chacha20(key: bytes, data: bytes) -> bytes:
+    nonce = os.urandom(AEAD_NONCE_SIZE)
+    return nonce + ChaCha20Poly1305(key).encrypt(nonce, bytes(data), None)
+
+def decrypt_data_chacha20(key: bytes, data: bytes) -> bytes:
+    view = memoryview(data)
+    return ChaCha20Poly1305(key).decrypt(bytes(view[:AEAD_NONCE_SIZE]), bytes(view[AEAD_NONCE_SIZE:]), None)
+
+def benchmark_aeads(size: int = AEAD_BENCHMARK_SIZE, rounds: int = AEAD_BENCHMARK_ROUNDS) -> dict:
+    """Encrypt rounds buffers of size bytes with each AEAD and return name -> best MB/s."""
+    data = os.urandom(size)
+    nonce = bytes(AEAD_NONCE_SIZE)  # Throwaway key, so a fixed nonce is harmless here
+    results = {}
+    for name, algorithm in AEAD_ALGORITHMS.items():
+        aead = algorithm(os.urandom(32))
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            aead.encrypt(nonce, data, None)
+            best = min(best, time.perf_counter() - start)
+        results[name] = size / (1024 * 1024) / max(best, 1e-9)
+    return results
+
+_aead_choice = None
+
+def preferred_aead(refresh: bool = False) -> str:
+    """
+    The faster AEAD on this machine, "AES-256-GCM" or "ChaCha20-Poly1305".
+
+    Measured once with benchmark_aeads and cached in AEAD_CHOICE_PATH, so later runs only read
+    the file. ChaCha20-Poly1305 wins on CPUs without AES instructions.
+    """
+    global _aead_choice
+    if _aead_choice is not None and not refresh:
+        return _aead_choice
+    import json
+    if not refresh:
+        try:
+            with open(AEAD_CHOICE_PATH, "r", encoding="utf-8") as f:
+                choice = json.load(f)["aead"]
+            if choice in AEAD_ALGORITHMS:
+                _aead_choice = choice
+                return choice
+        except (OSError, ValueError, KeyError):
+            pass
+    results = benchmark_aeads()
+    _aead_choice = max(results, key=results.get)
+    try:
+        os.makedirs(os.path.dirname(AEAD_CHOICE_PATH), exist_ok=True)
+        with open(AEAD_CHOICE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"aead": _aead_choice, "mb_per_s": results}, f, indent=2)
+    except OSError:
+        pass  # Benchmarking again next run is the only cost
+    return _aead_choice
+
+def _aes_cipher(key: bytes, iv: bytes, mode: str, tag: bytes = None) -> Cipher:
     if mode == "CFB":
-        cipher = Cipher(algorithms.AES(key), modes.CFB(iv))
+        return Cipher(algorithms.AES(key), modes.CFB(iv))
     elif mode == "GCM":
-        cipher = Cipher(algorithms.AES(key), modes.GCM(iv))
-    else:
-        raise ValueError("Unsupported AES mode")
-    encryptor = cipher.encryptor()
+        return Cipher(algorithms.AES(key), modes.GCM(iv, tag))
+    raise ValueError("Unsupported AES mode")
+
+def encrypt_data_aes(key: bytes, data: bytes, mode: str = "CFB") -> bytes:
+    iv = os.urandom(16)
+    encryptor = _aes_cipher(key, iv, mode).encryptor()
     ciphertext = encryptor.update(data) + encryptor.finalize()
     if mode == "GCM":
-        return iv + encryptor.tag + ciphertext  # Include GCM tag for integrity
+        return b"".join((iv, encryptor.tag, ciphertext))  # Include GCM tag for integrity
     return iv + ciphertext
 
 def decrypt_data_aes(key: bytes, data: bytes, mode: str = "CFB") -> bytes:
-    if mode == "CFB":
-        iv = data[:16]
-        cipher = Cipher(algorithms.AES(key), modes.CFB(iv))
-        decryptor = cipher.decryptor()
-        return decryptor.update(data[16:]) + decryptor.finalize()
-    elif mode == "GCM":
-        iv = data[:16]
-        tag = data[16:32]
-        ciphertext = data[32:]
-        cipher = Cipher(algorithms.AES(key), modes.GCM(iv, tag))
-        decryptor = cipher.decryptor()
-        return decryptor.update(ciphertext) + decryptor.finalize()
+    view = memoryview(data)
+    if mode == "GCM":
+        decryptor = _aes_cipher(key, bytes(view[:16]), mode, bytes(view[16:32])).decryptor()
+        return decryptor.update(view[32:]) + decryptor.finalize()
+    decryptor = _aes_cipher(key, bytes(view[:16]), mode).decryptor()
+    return decryptor.update(view[16:]) + decryptor.finalize()
+
+def encrypt_aes_into(key: bytes, src, dst: bytearray, mode: str = "CFB"):
+    """
+    Encrypt src into the preallocated dst with update_into (no ciphertext allocation).
+
+    dst must hold at least len(src) + AES_BLOCK_SIZE - 1 bytes.
+
+    Returns:
+        tuple: (record prefix: IV, plus the tag for GCM; memoryview of the ciphertext in dst)
+    """
+    iv = os.urandom(16)
+    encryptor = _aes_cipher(key, iv, mode).encryptor()
+    written = encryptor.update_into(src, dst)
+    encryptor.finalize()
+    prefix = iv + encryptor.tag if mode == "GCM" else iv
+    return prefix, memoryview(dst)[:written]
+
+def decrypt_aes_into(key: bytes, src, dst: bytearray, mode: str = "CFB"):
+    """Decrypt an encrypt_data_aes record from src into dst; returns a memoryview of the plaintext."""
+    view = memoryview(src)
+    if mode == "GCM":
+        decryptor = _aes_cipher(key, bytes(view[:16]), mode, bytes(view[16:32])).decryptor()
+        written = decryptor.update_into(view[32:], dst)
     else:
-        raise ValueError("Unsupported AES mode")
-
-def derive_key_from_password(password: str, salt: bytes, key_length: int) -> bytes:
-    """Derive a key from a password using PBKDF2HMAC."""
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=key_length,
-        salt=salt,
-        iterations=100000,  # Strong iteration count for security
-    )
-    return kdf.derive(password.encode())
-
-def encrypt_file_in_chunks(encrypt_func, key, in_path, out_path, progress_tracker=None):
+        decryptor = _aes_cipher(key, bytes(view[:16]), mode).decryptor()
+        written = decryptor.update_into(view[16:], dst)
+    decryptor.finalize()
+    return memoryview(dst)[:written]
+
+class BufferPool:
+    """Fixed set of reusable bytearrays; acquire blocks until a buffer is released."""
+    def __init__(self, count: int, size: int):
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def acquire(self, min_size: int = 0) -> bytearray:
+        """Take a pooled buffer, or allocate a one-off buffer if min_size exceeds the pool size."""
+        if min_size > self.size:
+            return bytearray(min_size)
+        buffer = self._free.get()
+        if buffer is None:
+            self._free.put(None)  # Wake the next waiter too
+            raise ValueError("Buffer pool closed")
+        return buffer
+
+    def close(self):
+        """Make waiting and later acquire calls raise ValueError, e.g. to stop a reader after a failure."""
+        self._free.put(None)
+
+    def release(self, buffer: bytearray):
+        """Return a buffer to the pool; one-off buffers are dropped."""
+        if len(buffer) == self.size:
+            self._free.put(buffer)
+
+def write_buffers(fout, buffers):
+    """Write several buffers to an unbuffered file, with a single writev where the platform has it."""
+    views = [memoryview(buffer).cast("B") for buffer in buffers if len(buffer)]
+    fd = fout.fileno()
+    while views:
+        if hasattr(os, "writev"):
+            written = os.writev(fd, views)
+        else:
+            written = fout.write(views[0])
+        while views and written >= len(views[0]):
+            written -= len(views[0])
+            views.pop(0)
+        if written:
+            views[0] = views[0][written:]
+
+def _aes_mode(func, aes_func):
+    """Return the AES mode if func is aes_func or a functools.partial of it, otherwise None."""
+    if func is aes_func:
+        return "CFB"
+    if isinstance(func, partial) and func.func is aes_func and not func.args:
+        return func.keywords.get("mode", "CFB")
+    return None
+
+def stream_nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    """Build a chunk nonce from the per-file prefix, the chunk counter and the last-chunk flag."""
+    if counter >= 2 ** 32:
+        raise OverflowError("Too many chunks for one stream")
+    return prefix + counter.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+def derive_stream_key(key: bytes, salt: bytes, algorithm: str) -> bytes:
+    """HKDF-SHA256 subkey of key for one stream, so files under one key never share a (key, nonce) pair."""
+    return HKDF(algorithm=hashes.SHA256(), length=len(key), salt=salt,
+                info=b"SecureVault STREAM " + algorithm.encode()).derive(key)
+
+class StreamCipher:
+    """
+    Single AEAD context for a whole file (STREAM construction).
+
+    Chunk i is sealed under stream_nonce(prefix, i, last), so reordering, dropping or
+    truncating chunks fails authentication. Ciphertext is raw binary with a 16-byte tag.
+    Chunks are (index, last, data) tuples so they can be sealed out of order by worker threads.
+    With a salt the AEAD key is derive_stream_key(key, salt), as in Tink's streaming AEAD;
+    without one key is used directly (containers written before the salt existed).
+    """
+    def __init__(self, algorithm: str, key: bytes, prefix: bytes = None, associated_data: bytes = b"",
+                 salt: bytes = None):
+        if algorithm not in AEAD_ALGORITHMS:
+            raise ValueError(f"Unsupported AEAD algorithm: {algorithm}")
+        if salt is not None:
+            key = derive_stream_key(key, salt, algorithm)
+        self.aead = AEAD_ALGORITHMS[algorithm](key)
+        self.prefix = prefix or os.urandom(STREAM_NONCE_PREFIX_SIZE)
+        if len(self.prefix) != STREAM_NONCE_PREFIX_SIZE:
+            raise ValueError("Invalid stream nonce prefix")
+        self.associated_data = associated_data
+
+    def encrypt_chunk(self, index: int, last: bool, data: bytes) -> bytes:
+        return self.aead.encrypt(stream_nonce(self.prefix, index, last), data, self.associated_data)
+
+    def decrypt_chunk(self, index: int, last: bool, data: bytes) -> bytes:
+        return self.aead.decrypt(stream_nonce(self.prefix, index, last), data, self.associated_data)
+
+def encrypt_chunk_stream(stream: StreamCipher, chunk: tuple) -> bytes:
+    """process_chunks adapter: seal an (index, last, data) chunk."""
+    return stream.encrypt_chunk(*chunk)
+
+def decrypt_chunk_stream(stream: StreamCipher, chunk: tuple) -> bytes:
+    """process_chunks adapter: open an (index, last, data) chunk."""
+    return stream.decrypt_chunk(*chunk)
+
+def number_chunks(chunks):
+    """Turn an iterable of chunks into (index, last, data) tuples; an empty input yields one empty last chunk."""
+    index = 0
+    previous = None
+    for chunk in chunks:
+        if previous is not None:
+            yield index, False, previous
+            index += 1
+        previous = chunk
+    yield index, True, previous if previous is not None else b""
+
+def _make_kdf(kdf: str, params: dict, salt: bytes, key_length: int):
+    if kdf == "PBKDF2-SHA256":
+        return PBKDF2HMAC(algorithm=hashes.SHA256(), length=key_length, salt=salt, iterations=params["iterations"])
+    elif kdf == "scrypt":
+        return Scrypt(salt=salt, length=key_length, n=params["n"], r=params["r"], p=params["p"])
+    elif kdf == "Argon2id":
+        if not ARGON2_AVAILABLE:
+            raise ValueError("Argon2id requires cryptography 44 or newer")
+        return Argon2id(salt=salt, length=key_length, iterations=params["iterations"],
+                        lanes=params["lanes"], memory_cost=params["memory_cost"])
+    raise ValueError(f"Unsupported KDF: {kdf}")
+
+def derive_key(password: str, salt: bytes, key_length: int, kdf: str = "PBKDF2-SHA256",
+               params: dict = None, cache=None) -> bytes:
+    """
+    Derive a key from a password with PBKDF2-SHA256, scrypt or Argon2id.
+
+    Args:
+        password (str): The password.
+        salt (bytes): Random salt stored with the file.
+        key_length (int): Key length in bytes.
+        kdf (str): One of KDF_DEFAULTS.
+        params (dict): Cost parameters (default: KDF_DEFAULTS for the KDF).
+        cache (DerivedKeyCache): Optional cache consulted before deriving.
+    """
+    if kdf not in KDF_DEFAULTS:
+        raise ValueError(f"Unsupported KDF: {kdf}")
+    params = params or KDF_DEFAULTS[kdf][1]
+    if cache is not None:
+        index = cache.make_index(password, salt, key_length, (kdf,) + tuple(sorted(params.items())))
+        key = cache.get(index)
+        if key is not None:
+            return key
+    start = time.perf_counter()
+    key = _make_kdf(kdf, params, salt, key_length).derive(password.encode())
+    KDF_SECONDS.observe(time.perf_counter() - start, kdf=kdf)
+    if cache is not None:
+        cache.put(index, key)
+    return key
+
+def derive_key_from_password(password: str, salt: bytes, key_length: int, cache=None) -> bytes:
+    """Derive a key from a password using PBKDF2HMAC, consulting a DerivedKeyCache if given."""
+    return derive_key(password, salt, key_length, "PBKDF2-SHA256", {"iterations": PBKDF2_ITERATIONS}, cache)
+
+def kdf_memory(kdf: str, params: dict) -> int:
+    """Bytes one derivation needs: 128 * N * r for scrypt, memory_cost KiB for Argon2id, none for PBKDF2."""
+    if kdf == "scrypt":
+        return 128 * params["n"] * params["r"]
+    elif kdf == "Argon2id":
+        return params["memory_cost"] * 1024
+    return 0
+
+def _kdf_passes(kdf: str, params: dict) -> int:
+    return params["p"] if kdf == "scrypt" else params["iterations"]
+
+def check_kdf_params(kdf: str, params: dict) -> dict:
+    """Return params, or raise ValueError if any cost exceeds KDF_MAXIMUMS, KDF_MAX_MEMORY or KDF_MAX_WORK."""
+    for name, maximum in KDF_MAXIMUMS[kdf].items():
+        if params[name] > maximum:
+            raise ValueError(f"{kdf} {name} of {params[name]} exceeds the maximum of {maximum}")
+    memory = kdf_memory(kdf, params)
+    if memory > KDF_MAX_MEMORY:
+        raise ValueError(f"{kdf} parameters need {memory // 2 ** 20} MiB, more than the maximum of "
+                         f"{KDF_MAX_MEMORY // 2 ** 20} MiB")
+    if memory * _kdf_passes(kdf, params) > KDF_MAX_WORK:
+        raise ValueError(f"{kdf} parameters make {_kdf_passes(kdf, params)} passes over {memory // 2 ** 20} MiB, "
+                         f"more than the maximum of {KDF_MAX_WORK // 2 ** 20} MiB in total")
+    return params
+
+def _time_kdf(kdf: str, params: dict) -> float:
+    start = time.perf_counter()
+    _make_kdf(kdf, params, os.urandom(16), 32).derive(b"calibration")
+    return time.perf_counter() - start
+
+def calibrate_kdf(kdf: str = "PBKDF2-SHA256", target_seconds: float = KDF_TARGET_SECONDS) -> dict:
+    """
+    Measure this machine and return KDF cost parameters that take about target_seconds.
+
+    PBKDF2 scales its iteration count; scrypt doubles N (r=8, p=1); Argon2id keeps 64 MiB
+    and scales passes, lowering memory only if a single pass is already too slow.
+    Costs never go below KDF_MINIMUMS or beyond what check_kdf_params accepts.
+    """
+    if kdf not in KDF_DEFAULTS:
+        raise ValueError(f"Unsupported KDF: {kdf}")
+    minimum = KDF_MINIMUMS[kdf]
+    maximum = KDF_MAXIMUMS[kdf]
+    if kdf == "PBKDF2-SHA256":
+        probe = {"iterations": 20000}
+        elapsed = _time_kdf(kdf, probe)
+        iterations = int(probe["iterations"] * target_seconds / max(elapsed, 1e-6))
+        return {"iterations": min(maximum["iterations"], max(minimum["iterations"], iterations // 1000 * 1000))}
+    elif kdf == "scrypt":
+        params = dict(minimum)
+        # Each doubling of N doubles the time; stop before overshooting the target
+        while (params["n"] < maximum["n"] and kdf_memory(kdf, dict(params, n=params["n"] * 2)) <= KDF_MAX_MEMORY
+               and _time_kdf(kdf, dict(params, n=params["n"] * 2)) <= target_seconds):
+            params["n"] *= 2
+        return params
+    else:
+        params = {"iterations": 1, "memory_cost": KDF_DEFAULTS[kdf][1]["memory_cost"],
+                  "lanes": KDF_DEFAULTS[kdf][1]["lanes"]}
+        elapsed = _time_kdf(kdf, params)
+        while elapsed > target_seconds and params["memory_cost"] > minimum["memory_cost"]:
+            params["memory_cost"] //= 2
+            elapsed = _time_kdf(kdf, params)
+        most = min(maximum["iterations"], KDF_MAX_WORK // kdf_memory(kdf, params))
+        params["iterations"] = min(most, max(minimum["iterations"], int(target_seconds / max(elapsed, 1e-6))))
+        return params
+
+_kdf_calibration = None
+_kdf_calibration_lock = threading.Lock()
+
+def calibrated_kdf_params(kdf: str = "PBKDF2-SHA256", refresh: bool = False) -> dict:
+    """
+    calibrate_kdf's parameters for kdf on this machine.
+
+    Measured once per KDF and cached in KDF_CALIBRATION_PATH, so later files and later runs
+    only read the file. Cached values that check_kdf_params rejects are measured again.
+    """
+    global _kdf_calibration
+    import json
+    with _kdf_calibration_lock:
+        if _kdf_calibration is None:
+            try:
+                with open(KDF_CALIBRATION_PATH, "r", encoding="utf-8") as f:
+                    _kdf_calibration = dict(json.load(f))
+            except (OSError, ValueError, TypeError):
+                _kdf_calibration = {}
+        params = _kdf_calibration.get(kdf)
+        if not refresh:
+            try:
+                return dict(check_kdf_params(kdf, params))
+            except (KeyError, TypeError, ValueError):
+                pass  # Missing, from an older version or edited by hand
+        params = _kdf_calibration[kdf] = calibrate_kdf(kdf)
+        try:
+            os.makedirs(os.path.dirname(KDF_CALIBRATION_PATH), exist_ok=True)
+            with open(KDF_CALIBRATION_PATH, "w", encoding="utf-8") as f:
+                json.dump(_kdf_calibration, f, indent=2, sort_keys=True)
+        except OSError:
+            pass  # Calibrating again next run is the only cost
+        return dict(params)
+
+def process_chunks(func, key, chunks, workers=None, max_in_flight=None, use_processes=False):
+    """
+    Apply func(key, chunk) to every chunk on a worker pool and yield results in input order.
+
+    Args:
+        func (callable): Chunk function such as encrypt_data_fernet; must be picklable for processes.
+        key (bytes): Key passed as the first argument to func.
+        chunks (iterable): Iterable of input chunks.
+        workers (int): Pool size; 1 runs inline on the calling thread (default: DEFAULT_WORKERS).
+        max_in_flight (int): Maximum chunks submitted but not yet yielded.
+        use_processes (bool): Use a process pool instead of a thread pool.
+
+    Yields:
+        tuple: (input chunk, func result) in the same order as chunks.
+    """
+    workers = workers or DEFAULT_WORKERS
+    if workers <= 1:
+        for chunk in chunks:
+            yield chunk, func(key, chunk)
+        return
+
+    max_in_flight = max(1, max_in_flight or workers * IN_FLIGHT_PER_WORKER)
+    if use_processes:
+        from concurrent.futures import ProcessPoolExecutor as executor_cls
+    else:
+        executor_cls = ThreadPoolExecutor
+    executor = executor_cls(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(func, key, chunk)))
+            if len(pending) >= max_in_flight:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    finally:
+        for _, future in pending:  # shutdown(cancel_futures=True) needs Python 3.9
+            future.cancel()
+        executor.shutdown(wait=True)
+
+class StageStats:
+    """Seconds one pipeline stage spent working (busy) and not working (idle) during a run."""
+    def __init__(self, name: str):
+        self.name = name
+        self.busy = 0.0
+        self.idle = 0.0
+        self.items = 0
+
+    @property
+    def utilization(self) -> float:
+        total = self.busy + self.idle
+        return self.busy / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {"busy": self.busy, "idle": self.idle, "items": self.items, "utilization": self.utilization}
+
+class PipelineStats:
+    """
+    Per-stage timings of one run_pipeline call.
+
+    Every stage's idle time is its share of the run's wall time spent not working, so a
+    reader that finishes early counts as idle for the rest of the run. crypto.busy is summed
+    over the workers and crypto.idle is workers * wall time minus that, so its utilization
+    is the share of the worker pool kept busy. bound names the stage with the highest
+    utilization: "read" or "write" for a disk-bound run, "crypto" for a CPU-bound one.
+    """
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self.read = StageStats("read")
+        self.crypto = StageStats("crypto")
+        self.write = StageStats("write")
+        self.wall = 0.0
+
+    @property
+    def stages(self) -> tuple:
+        return self.read, self.crypto, self.write
+
+    @property
+    def bound(self) -> str:
+        return max(self.stages, key=lambda stage: stage.utilization).name
+
+    def as_dict(self) -> dict:
+        result = {stage.name: stage.as_dict() for stage in self.stages}
+        result.update(workers=self.workers, wall=self.wall, bound=self.bound)
+        return result
+
+    def record(self, operation):
+        """Add the stage times to the metrics registry."""
+        for stage in self.stages:
+            STAGE_BUSY_SECONDS.inc(stage.busy, operation=operation, stage=stage.name)
+            STAGE_IDLE_SECONDS.inc(stage.idle, operation=operation, stage=stage.name)
+
+_STAGE_DONE = object()
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+def timed_call(func, key, chunk):
+    """process_chunks function wrapping func so each chunk can be timed, in processes too; returns (seconds, result)."""
+    start = time.perf_counter()
+    result = func(key, chunk)
+    return time.perf_counter() - start, result
+
+def _reader_stage(chunks, depth, stats):
+    """Drain the chunks iterator on its own thread, through a queue of at most depth items."""
+    items = queue.Queue(depth)
+    stop = threading.Event()
+
+    def run():
+        try:
+            iterator = iter(chunks)
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+                items.put(item)
+        except BaseException as e:
+            items.put(_StageError(e))
+            return
+        items.put(_STAGE_DONE)
+
+    thread = threading.Thread(target=run, name="securevault-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _STAGE_DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        try:  # Make room for a put blocked on the full queue; the reader then sees stop and exits
+            while True:
+                items.get_nowait()
+        except queue.Empty:
+            pass
+
+class _WriterStage:
+    """Thread calling write(item) for each put item in order, through a queue of at most depth items."""
+    def __init__(self, write, depth, stats):
+        self._write = write
+        self._items = queue.Queue(depth)
+        self._stats = stats
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="securevault-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._items.get()
+            got = time.perf_counter()
+            if item is _STAGE_DONE:
+                return
+            if self.error is not None:
+                continue  # Keep draining so put never blocks after a failed write
+            try:
+                self._write(item)
+            except BaseException as e:
+                self.error = e
+            self._stats.busy += time.perf_counter() - got
+            self._stats.items += 1
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self._items.put(item)
+
+    def close(self):
+        """Wait for every queued write and re-raise the first write error."""
+        self._items.put(_STAGE_DONE)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+def run_pipeline(func, key, chunks, write, workers=None, max_in_flight=None, use_processes=False,
+                 depth=PIPELINE_QUEUE_DEPTH, operation="encrypt") -> PipelineStats:
+    """
+    Three-stage pipeline: a reader thread draining chunks, process_chunks workers applying
+    func(key, chunk), and a writer thread calling write(chunk, result) in input order.
+
+    The stages are joined by queues of depth items, so reading, encryption and writing
+    overlap while memory stays bounded. Errors from any stage are raised here. Input bytes,
+    chunk latencies and stage times are recorded in the metrics registry under operation.
+
+    Args:
+        func (callable): Chunk function, as for process_chunks.
+        key (bytes): Key passed as the first argument to func.
+        chunks (iterable): Input chunks; iterated on the reader thread.
+        write (callable): write(chunk, result), called on the writer thread.
+        workers (int): Crypto workers (default: DEFAULT_WORKERS).
+        max_in_flight (int): Chunks submitted to the workers but not yet written.
+        use_processes (bool): Use a process pool for the crypto stage.
+        depth (int): Size of the reader and writer queues.
+        operation (str): "encrypt" or "decrypt", the metrics label.
+
+    Returns:
+        PipelineStats: Busy and idle time of each stage.
+    """
+    workers = workers or DEFAULT_WORKERS
+    stats = PipelineStats(workers)
+    start = time.perf_counter()
+    writer = _WriterStage(lambda item: write(*item), depth, stats.write)
+    reader = _reader_stage(chunks, depth, stats.read)
+    try:
+        for chunk, (elapsed, result) in process_chunks(partial(timed_call, func), key, reader,
+                                                       workers, max_in_flight, use_processes):
+            stats.crypto.busy += elapsed
+            stats.crypto.items += 1
+            CHUNK_SECONDS.observe(elapsed, operation=operation)
+            BYTES_PROCESSED.inc(len(chunk), operation=operation)
+            writer.put((chunk, result))
+    finally:
+        reader.close()
+        writer.close()
+    stats.wall = time.perf_counter() - start
+    stats.read.idle = max(0.0, stats.wall - stats.read.busy)
+    stats.crypto.idle = max(0.0, stats.wall * workers - stats.crypto.busy)
+    stats.write.idle = max(0.0, stats.wall - stats.write.busy)
+    stats.record(operation)
+    return stats
+
+def _read_chunks(fin, chunk_size):
+    while True:
+        chunk = fin.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+def _read_records(fin):
+    while True:
+        length_bytes = fin.read(4)
+        if not length_bytes:
+            break
+        if len(length_bytes) < 4:
+            raise ValueError("Truncated chunk length in encrypted file")
+        enc_len = int.from_bytes(length_bytes, "big")
+        enc_data = fin.read(enc_len)
+        if len(enc_data) < enc_len:
+            raise ValueError("Truncated chunk in encrypted file")
+        yield enc_data
+
+class _StreamHints:
+    """io_hints for one streaming job: sequential input, a preallocated output and drop-behind caching."""
+    def __init__(self, fin, fout, drop_cache, out_length=None, in_offset=0):
+        advise_sequential(fin.fileno(), in_offset)
+        self.out_length = out_length if out_length and preallocate_file(fout.fileno(), out_length) else None
+        self._caches = (DropBehind(fin.fileno(), in_offset), DropBehind(fout.fileno(), flush=True)) if drop_cache else None
+
+    def advance(self, read, written):
+        if self._caches:
+            self._caches[0].advance(read)
+            self._caches[1].advance(written)
+
+    def finish(self, fout):
+        if self.out_length is not None and fout.tell() != self.out_length:
+            fout.truncate()  # Less was written than preallocated, or the job failed part way
+        fout.flush()
+        if self._caches:
+            for cache in self._caches:
+                cache.finish()
+
+def _encrypted_file_length(encrypt_func, file_size, chunk_size, header):
+    """Size encrypt_file_in_chunks will write, or None if the method's ciphertext size is not known."""
+    full, rest = divmod(file_size, chunk_size)
+    if _ciphertext_length(encrypt_func, chunk_size) is None:
+        return None
+    length = len(header) + full * (4 + _ciphertext_length(encrypt_func, chunk_size))
+    return length + (4 + _ciphertext_length(encrypt_func, rest) if rest else 0)
+
+def _encrypt_file_buffered(key, mode, in_path, out_path, chunk_size, progress_tracker, workers, header,
+                           drop_cache=False, out_length=None):
+    """AES path of encrypt_file_in_chunks: readinto pooled buffers, update_into, one writev per record."""
     file_size = os.path.getsize(in_path)
     processed = 0
-    # Optimize chunk size based on available memory and file size
-    available_memory = psutil.virtual_memory().available
-    chunk_size = min(CHUNK_SIZE, max(1024 * 1024, available_memory // 4))
+    workers = workers or DEFAULT_WORKERS
+    in_flight = workers * IN_FLIGHT_PER_WORKER if workers > 1 else 1
+    # Buffers in flight, plus those queued for and held by the reader and writer stages
+    pool_size = in_flight + 2 * PIPELINE_QUEUE_DEPTH + 2
+    in_pool = BufferPool(pool_size, chunk_size)
+    out_pool = BufferPool(pool_size, chunk_size + AES_BLOCK_SIZE - 1)
 
-    with open(in_path, "rb") as fin, open(out_path, "wb") as fout:
+    def encrypt_into(key, view):
+        dst = out_pool.acquire()
+        prefix, payload = encrypt_aes_into(key, view, dst, mode)
+        return dst, prefix, payload
+
+    def read_views(fin):
         while True:
-            chunk = fin.read(chunk_size)
-            if not chunk:
+            buffer = in_pool.acquire()
+            size = fin.readinto(buffer)
+            if not size:
+                in_pool.release(buffer)
                 break
-            encrypted = encrypt_func(key, chunk)
-            fout.write(len(encrypted).to_bytes(4, "big"))
-            fout.write(encrypted)
-            processed += len(chunk)
-            if progress_tracker:
-                progress_tracker.update_progress(processed, file_size)
-
-def decrypt_file_in_chunks(decrypt_func, key, in_path, out_path, progress_tracker=None):
+            yield memoryview(buffer)[:size]
+
+    def write(view, result):
+        nonlocal processed
+        dst, prefix, payload = result
+        length = (len(prefix) + len(payload)).to_bytes(4, "big")
+        write_buffers(fout, [length + prefix, payload])
+        processed += len(view)
+        hints.advance(len(view), 4 + len(prefix) + len(payload))
+        in_pool.release(view.obj)
+        out_pool.release(dst)
+        if progress_tracker:
+            progress_tracker.update_progress(processed, file_size)
+
+    with open(in_path, "rb") as fin, open(out_path, "wb", buffering=0) as fout:
+        hints = _StreamHints(fin, fout, drop_cache, out_length)
+        write_buffers(fout, [header])
+        hints.advance(0, len(header))
+        try:
+            return run_pipeline(encrypt_into, key, read_views(fin), write, workers, in_flight)
+        finally:
+            in_pool.close()
+            hints.finish(fout)
+
+def _first_record_length(fin, data_offset):
+    """Ciphertext length of the first record, 0 if there is none; every record but the last has this length."""
+    fin.seek(data_offset)
+    length = fin.read(4)
+    fin.seek(data_offset)
+    return int.from_bytes(length, "big") if len(length) == 4 else 0
+
+def _decrypt_file_buffered(key, mode, in_path, out_path, progress_tracker, workers, data_offset, drop_cache=False):
+    """
+    AES path of decrypt_file_in_chunks: records are read into pooled buffers and decrypted with update_into.
+
+    The pools are sized from the first record, so files written with a tuned chunk size
+    reuse pooled buffers too. A first record larger than any tuned chunk (a hand-picked size
+    or a corrupt length) falls back to CHUNK_SIZE pools and one-off buffers.
+    """
     file_size = os.path.getsize(in_path)
-    processed = 0
+    processed = data_offset
+    workers = workers or DEFAULT_WORKERS
+    in_flight = workers * IN_FLIGHT_PER_WORKER if workers > 1 else 1
+    pool_size = in_flight + 2 * PIPELINE_QUEUE_DEPTH + 2
 
-    with open(in_path, "rb") as fin, open(out_path, "wb") as fout:
+    def decrypt_into(key, view):
+        dst = out_pool.acquire(len(view) + AES_BLOCK_SIZE - 1)
+        return dst, decrypt_aes_into(key, view, dst, mode)
+
+    def read_views(fin):
+        length = bytearray(4)
         while True:
-            length_bytes = fin.read(4)
-            if not length_bytes:
+            size = fin.readinto(length)
+            if not size:
                 break
-            enc_len = int.from_bytes(length_bytes, "big")
-            enc_data = fin.read(enc_len)
-            decrypted = decrypt_func(key, enc_data)
-            fout.write(decrypted)
-            processed += enc_len
-            if progress_tracker:
-                progress_tracker.update_progress(processed, file_size)
-
-def encrypt_file_with_password(password: str, in_path: str, out_path: str, method: str = "Fernet", progress_tracker=None):
+            if size < 4:
+                raise ValueError("Truncated chunk length in encrypted file")
+            enc_len = int.from_bytes(length, "big")
+            buffer = in_pool.acquire(enc_len)
+            view = memoryview(buffer)[:enc_len]
+            if fin.readinto(view) < enc_len:
+                raise ValueError("Truncated chunk in encrypted file")
+            yield view
+
+    def write(view, result):
+        nonlocal processed
+        dst, plaintext = result
+        write_buffers(fout, [plaintext])
+        processed += len(view) + 4
+        hints.advance(len(view) + 4, len(plaintext))
+        in_pool.release(view.obj)
+        out_pool.release(dst)
+        if progress_tracker:
+            progress_tracker.update_progress(processed, file_size)
+
+    with open(in_path, "rb") as fin, open(out_path, "wb", buffering=0) as fout:
+        hints = _StreamHints(fin, fout, drop_cache, in_offset=data_offset)
+        record_size = _first_record_length(fin, data_offset)
+        if not 0 < record_size <= MAX_TUNED_CHUNK_SIZE + 32:  # IV + GCM tag
+            record_size = CHUNK_SIZE + 32
+        in_pool = BufferPool(pool_size, record_size)
+        out_pool = BufferPool(pool_size, record_size + AES_BLOCK_SIZE - 1)
+        try:
+            return run_pipeline(decrypt_into, key, read_views(fin), write, workers, in_flight, operation="decrypt")
+        except BaseException:
+            fout.truncate(0)  # As decrypt_file_mmap: no plaintext from the records before a failed one
+            raise
+        finally:
+            in_pool.close()
+            hints.finish(fout)
+
+class MmapUnavailable(OSError):
+    """Raised when a file cannot be memory-mapped (unsupported filesystem, empty file, ...)."""
+
+def _map_file(fileobj, access):
+    try:
+        mapped = mmap.mmap(fileobj.fileno(), 0, access=access)
+    except (OSError, ValueError) as e:
+        raise MmapUnavailable(f"Cannot memory-map {fileobj.name}: {str(e)}")
+    if hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)  # Chunks are consumed front to back; read ahead aggressively
+    return mapped
+
+def _close_maps(*maps):
+    for mapped in maps:
+        try:
+            mapped.close()
+        except BufferError:
+            pass  # A traceback still references a view; the map is released with it
+
+def _ciphertext_length(encrypt_func, size):
+    """Exact ciphertext length encrypt_func produces for size plaintext bytes, or None if unknown."""
+    if encrypt_func is encrypt_data_fernet:
+        token = 1 + 8 + 16 + (size // AES_BLOCK_SIZE + 1) * AES_BLOCK_SIZE + 32
+        return (token + 2) // 3 * 4
+    if encrypt_func is encrypt_data_chacha20:
+        return AEAD_NONCE_SIZE + size + 16
+    mode = _aes_mode(encrypt_func, encrypt_data_aes)
+    if mode:
+        return size + (32 if mode == "GCM" else 16)
+    return None
+
+def encrypt_file_mmap(encrypt_func, key, in_path, out_path, progress_tracker=None, workers=None,
+                      header=b"", chunk_size=CHUNK_SIZE, drop_cache=False):
+    """
+    Encrypt a file through memory maps, producing the same records as encrypt_file_in_chunks.
+
+    The input is mapped read-only and the output is preallocated and mapped, so chunks are
+    sliced from one map and written into the other without a read or write call per chunk.
+    AES chunks are encrypted straight into the output map with update_into. With drop_cache
+    both files' pages are released from the page cache once the output is flushed.
+
+    Raises:
+        MmapUnavailable: If either file cannot be mapped; nothing useful has been written.
+    """
+    file_size = os.path.getsize(in_path)
+    mode = _aes_mode(encrypt_func, encrypt_data_aes)
+    if _ciphertext_length(encrypt_func, 0) is None:
+        raise MmapUnavailable("Ciphertext size of this method is not known in advance")
+
+    layout = []  # (input offset, size, output offset)
+    out_offset = len(header)
+    for offset in range(0, file_size, chunk_size):
+        size = min(chunk_size, file_size - offset)
+        layout.append((offset, size, out_offset))
+        out_offset += 4 + _ciphertext_length(encrypt_func, size)
+    slack = AES_BLOCK_SIZE - 1  # update_into needs block_size - 1 spare bytes past the last record
+
+    with open(in_path, "rb") as fin, open(out_path, "w+b") as fout:
+        fout.truncate(out_offset + slack)
+        preallocate_file(fout.fileno(), out_offset + slack)
+        in_map = _map_file(fin, mmap.ACCESS_READ)
+        try:
+            out_map = _map_file(fout, mmap.ACCESS_WRITE)
+        except MmapUnavailable:
+            in_map.close()
+            raise
+        try:
+            out_map[:len(header)] = header
+
+            def encrypt_record(key, item):
+                src_start, size, dst_start = item
+                with memoryview(in_map) as src_view, memoryview(out_map) as dst_view:
+                    src = src_view[src_start:src_start + size]
+                    if mode:
+                        prefix_len = 32 if mode == "GCM" else 16
+                        body = dst_start + 4 + prefix_len
+                        prefix, payload = encrypt_aes_into(key, src, dst_view[body:body + size + slack], mode)
+                        payload.release()
+                        encrypted_len = prefix_len + size
+                        dst_view[dst_start + 4:body] = prefix
+                    else:
+                        encrypted = encrypt_func(key, bytes(src))
+                        encrypted_len = len(encrypted)
+                        if encrypted_len != _ciphertext_length(encrypt_func, size):
+                            raise ValueError("Unexpected ciphertext length")
+                        dst_view[dst_start + 4:dst_start + 4 + encrypted_len] = encrypted
+                    dst_view[dst_start:dst_start + 4] = encrypted_len.to_bytes(4, "big")
+                    src.release()
+                return size
+
+            processed = 0
+            for _, (elapsed, size) in process_chunks(partial(timed_call, encrypt_record), key, layout, workers):
+                CHUNK_SECONDS.observe(elapsed, operation="encrypt")
+                BYTES_PROCESSED.inc(size, operation="encrypt")
+                processed += size
+                if progress_tracker:
+                    progress_tracker.update_progress(processed, file_size)
+            out_map.flush()
+        except BaseException:
+            _close_maps(in_map, out_map)
+            fout.truncate(0)  # Do not leave a full-size file of partly written records
+            raise
+        _close_maps(in_map, out_map)
+        fout.truncate(out_offset)
+        if drop_cache:
+            drop_file_cache(fin.fileno())
+            drop_file_cache(fout.fileno())
+
+def decrypt_file_mmap(decrypt_func, key, in_path, out_path, progress_tracker=None, workers=None, data_offset=0,
+                      drop_cache=False):
+    """
+    Decrypt a file written by encrypt_file_in_chunks through memory maps.
+
+    The output is preallocated to the total ciphertext size (an upper bound on the plaintext)
+    and truncated to the real size at the end, or to nothing if any record fails to decrypt.
+
+    Raises:
+        MmapUnavailable: If either file cannot be mapped.
+    """
+    file_size = os.path.getsize(in_path)
+    mode = _aes_mode(decrypt_func, decrypt_data_aes)
+    slack = AES_BLOCK_SIZE - 1
+
+    with open(in_path, "rb") as fin, open(out_path, "w+b") as fout:
+        in_map = _map_file(fin, mmap.ACCESS_READ)
+        records = []  # (record offset, ciphertext length)
+        offset = data_offset
+        while offset < len(in_map):
+            if offset + 4 > len(in_map):
+                in_map.close()
+                raise ValueError("Truncated chunk length in encrypted file")
+            enc_len = int.from_bytes(in_map[offset:offset + 4], "big")
+            if offset + 4 + enc_len > len(in_map):
+                in_map.close()
+                raise ValueError("Truncated chunk in encrypted file")
+            records.append((offset + 4, enc_len))
+            offset += 4 + enc_len
+        fout.truncate(sum(enc_len for _, enc_len in records) + slack)
+        try:
+            out_map = _map_file(fout, mmap.ACCESS_WRITE)
+        except MmapUnavailable:
+            in_map.close()
+            raise
+        try:
+            # AES plaintext sizes are known up front, so workers decrypt straight into the output map
+            layout = []
+            out_offset = 0
+            for start, enc_len in records:
+                layout.append((start, enc_len, out_offset))
+                if mode:
+                    out_offset += enc_len - (32 if mode == "GCM" else 16)
+
+            scratch = threading.local()  # Per-worker GCM buffer
+
+            def decrypt_record(key, item):
+                start, enc_len, dst_start = item
+                with memoryview(in_map) as src_view:
+                    src = src_view[start:start + enc_len]
+                    if mode == "GCM":
+                        # Plaintext reaches the output map only once its tag has been verified
+                        size = enc_len - 32
+                        buffer = getattr(scratch, "buffer", None)
+                        if buffer is None or len(buffer) < size + slack:
+                            buffer = scratch.buffer = bytearray(size + slack)
+                        with decrypt_aes_into(key, src, buffer, mode) as plaintext, memoryview(out_map) as dst_view:
+                            dst_view[dst_start:dst_start + size] = plaintext
+                        src.release()
+                        return None
+                    if mode:
+                        size = enc_len - 16
+                        with memoryview(out_map) as dst_view:
+                            decrypt_aes_into(key, src, dst_view[dst_start:dst_start + size + slack], mode).release()
+                        src.release()
+                        return None
+                    plaintext = decrypt_func(key, bytes(src))
+                    src.release()
+                    return plaintext
+
+            processed = data_offset
+            written = out_offset
+            for (start, enc_len, _), (elapsed, plaintext) in process_chunks(partial(timed_call, decrypt_record), key,
+                                                                            layout, workers):
+                CHUNK_SECONDS.observe(elapsed, operation="decrypt")
+                BYTES_PROCESSED.inc(enc_len, operation="decrypt")
+                if plaintext is not None:
+                    out_map[written:written + len(plaintext)] = plaintext
+                    written += len(plaintext)
+                processed += 4 + enc_len
+                if progress_tracker:
+                    progress_tracker.update_progress(processed, file_size)
+            out_map.flush()
+        except BaseException:
+            _close_maps(in_map, out_map)
+            fout.truncate(0)  # A failed tag must not leave the other records' plaintext on disk
+            raise
+        _close_maps(in_map, out_map)
+        fout.truncate(written)
+        if drop_cache:
+            drop_file_cache(fin.fileno())
+            drop_file_cache(fout.fileno())
+
+def encrypt_file_in_chunks(encrypt_func, key, in_path, out_path, progress_tracker=None,
+                           workers=None, use_processes=False, header=b"", zero_copy=True, use_mmap=None,
+                           chunk_size=None, preallocate=True, drop_cache=None):
+    """
+    Encrypt a file chunk by chunk as [4-byte length][ciphertext] records.
+
+    Chunks are encrypted in parallel by process_chunks and written in order.
+    header is written before the first record (used for password-based files).
+    AES functions take the zero-copy buffer pool path unless zero_copy is False or
+    use_processes is set (pooled buffers cannot be shared with other processes).
+    use_mmap=None picks encrypt_file_mmap for files of MMAP_THRESHOLD bytes and above;
+    if the files cannot be mapped the streaming paths are used instead.
+    chunk_size="auto" uses the size chunk_tuner measured for this function and output device;
+    None does so for files of TUNE_THRESHOLD bytes and above and uses CHUNK_SIZE otherwise.
+    Records carry their own lengths, so decryption does not need to know the size.
+    preallocate reserves the output's full size up front (when the method's ciphertext size
+    is known) so it is written in few extents. drop_cache=None streams files of
+    DROP_CACHE_THRESHOLD bytes and above without leaving their pages in the page cache,
+    so a long job does not evict other processes' working sets.
+
+    The streaming paths run as a run_pipeline of reader thread, crypto workers and writer
+    thread, and return its PipelineStats; the mmap path returns None.
+    """
+    file_size = os.path.getsize(in_path)
+    processed = 0
+    if chunk_size is None:
+        chunk_size = "auto" if file_size >= TUNE_THRESHOLD else CHUNK_SIZE
+    if chunk_size == "auto":
+        from chunk_tuner import tuned_chunk_size_for_func
+        chunk_size = tuned_chunk_size_for_func(encrypt_func, key, out_path, workers)
+    if drop_cache is None:
+        drop_cache = file_size >= DROP_CACHE_THRESHOLD
+    out_length = _encrypted_file_length(encrypt_func, file_size, chunk_size, header) if preallocate else None
+
+    if use_mmap is None:
+        use_mmap = file_size >= MMAP_THRESHOLD
+    if use_mmap and not use_processes:
+        try:
+            encrypt_file_mmap(encrypt_func, key, in_path, out_path, progress_tracker, workers, header, chunk_size,
+                              drop_cache)
+            return None
+        except MmapUnavailable:
+            pass
+
+    mode = _aes_mode(encrypt_func, encrypt_data_aes) if zero_copy and not use_processes else None
+    if mode:
+        return _encrypt_file_buffered(key, mode, in_path, out_path, chunk_size, progress_tracker, workers, header,
+                                      drop_cache, out_length)
+
+    def write(chunk, encrypted):
+        nonlocal processed
+        fout.write(len(encrypted).to_bytes(4, "big"))
+        fout.write(encrypted)
+        processed += len(chunk)
+        hints.advance(len(chunk), 4 + len(encrypted))
+        if progress_tracker:
+            progress_tracker.update_progress(processed, file_size)
+
+    with open(in_path, "rb") as fin, open(out_path, "wb") as fout:
+        hints = _StreamHints(fin, fout, drop_cache, out_length)
+        fout.write(header)
+        hints.advance(0, len(header))
+        try:
+            return run_pipeline(encrypt_func, key, _read_chunks(fin, chunk_size), write, workers,
+                                use_processes=use_processes)
+        finally:
+            hints.finish(fout)
+
+def decrypt_file_in_chunks(decrypt_func, key, in_path, out_path, progress_tracker=None,
+                           workers=None, use_processes=False, data_offset=0, zero_copy=True, use_mmap=None,
+                           drop_cache=None):
+    """
+    Decrypt a file written by encrypt_file_in_chunks, starting data_offset bytes into it.
+
+    Records are decrypted in parallel by process_chunks and written in order.
+    AES functions take the zero-copy buffer pool path, and large files the mmap path,
+    as in encrypt_file_in_chunks, and the PipelineStats of the streaming paths are returned.
+    On any failure, such as a chunk failing authentication, every path leaves out_path empty.
+    drop_cache is as for encrypt_file_in_chunks.
+    """
+    file_size = os.path.getsize(in_path)
+    if drop_cache is None:
+        drop_cache = file_size >= DROP_CACHE_THRESHOLD
+    if use_mmap is None:
+        use_mmap = file_size >= MMAP_THRESHOLD
+    if use_mmap and not use_processes:
+        try:
+            decrypt_file_mmap(decrypt_func, key, in_path, out_path, progress_tracker, workers, data_offset, drop_cache)
+            return None
+        except MmapUnavailable:
+            pass
+    mode = _aes_mode(decrypt_func, decrypt_data_aes) if zero_copy and not use_processes else None
+    if mode:
+        return _decrypt_file_buffered(key, mode, in_path, out_path, progress_tracker, workers, data_offset,
+                                      drop_cache)
+    processed = data_offset
+
+    def write(enc_data, decrypted):
+        nonlocal processed
+        fout.write(decrypted)
+        processed += len(enc_data) + 4
+        hints.advance(len(enc_data) + 4, len(decrypted))
+        if progress_tracker:
+            progress_tracker.update_progress(processed, file_size)
+
+    with open(in_path, "rb") as fin, open(out_path, "wb") as fout:
+        hints = _StreamHints(fin, fout, drop_cache, in_offset=data_offset)
+        fin.seek(data_offset)
+        try:
+            return run_pipeline(decrypt_func, key, _read_records(fin), write, workers, use_processes=use_processes,
+                                operation="decrypt")
+        except BaseException:
+            fout.truncate(0)
+            raise
+        finally:
+            hints.finish(fout)
+
+# Password header v2: magic, version, method byte, KDF id, three KDF cost fields, salt length; then the salt.
+# Cost fields: PBKDF2 (iterations, 0, 0), scrypt (log2 N, r, p), Argon2id (iterations, memory KiB, lanes).
+# v1 files have the method byte (an ASCII letter) straight after the magic and always use PBKDF2.
+PASSWORD_HEADER_VERSION = 2
+PASSWORD_HEADER = struct.Struct(">4sBcBIIIB")
+PASSWORD_METHODS = {'Fernet': 'F', 'AES-128': 'A', 'AES-192': 'B', 'AES-256': 'C', 'AES-256-GCM': 'G',
+                    'ChaCha20-Poly1305': 'H'}
+
+def _pack_kdf_params(kdf: str, params: dict) -> tuple:
+    if kdf == "PBKDF2-SHA256":
+        return params["iterations"], 0, 0
+    elif kdf == "scrypt":
+        return params["n"].bit_length() - 1, params["r"], params["p"]
+    return params["iterations"], params["memory_cost"], params["lanes"]
+
+def _unpack_kdf_params(kdf: str, fields: tuple) -> dict:
+    if kdf == "PBKDF2-SHA256":
+        return {"iterations": fields[0]}
+    elif kdf == "scrypt":
+        if fields[0] >= KDF_MAXIMUMS[kdf]["n"].bit_length():
+            raise ValueError(f"scrypt n of 2^{fields[0]} exceeds the maximum of {KDF_MAXIMUMS[kdf]['n']}")
+        return {"n": 2 ** fields[0], "r": fields[1], "p": fields[2]}
+    return {"iterations": fields[0], "memory_cost": fields[1], "lanes": fields[2]}
+
+def pack_password_header(method_byte: str, kdf: str, params: dict, salt: bytes) -> bytes:
+    """Build a v2 password header recording the method, KDF, cost parameters and salt."""
+    return PASSWORD_HEADER.pack(b'SVEP', PASSWORD_HEADER_VERSION, method_byte.encode(), KDF_DEFAULTS[kdf][0],
+                                *_pack_kdf_params(kdf, params), len(salt)) + salt
+
+def read_password_header(fin):
+    """
+    Parse a v1 or v2 password header from the start of an open file.
+
+    KDF costs above KDF_MAXIMUMS raise ValueError before any key is derived.
+
+    Returns:
+        tuple: (method byte, KDF name, KDF parameters, salt); the file is left at the first record.
+    """
+    magic = fin.read(4)
+    if magic != b'SVEP':
+        raise ValueError("Invalid file format or not password-encrypted")
+    version = fin.read(1)
+    if version != bytes([PASSWORD_HEADER_VERSION]):
+        # v1: the byte after the magic is the method, followed by a 16-byte salt
+        return version.decode(), "PBKDF2-SHA256", {"iterations": PBKDF2_ITERATIONS}, fin.read(16)
+    rest = fin.read(PASSWORD_HEADER.size - 5)
+    if len(rest) < PASSWORD_HEADER.size - 5:
+        raise ValueError("Truncated password header")
+    _, _, method_byte, kdf_id, cost1, cost2, cost3, salt_len = PASSWORD_HEADER.unpack(magic + version + rest)
+    if kdf_id not in KDF_NAMES:
+        raise ValueError("Unsupported KDF in file header")
+    kdf = KDF_NAMES[kdf_id]
+    params = check_kdf_params(kdf, _unpack_kdf_params(kdf, (cost1, cost2, cost3)))
+    return method_byte.decode(), kdf, params, fin.read(salt_len)
+
+def encrypt_file_with_password(password: str, in_path: str, out_path: str, method: str = "Fernet", progress_tracker=None,
+                               workers=None, use_processes=False, key_cache=KEY_CACHE,
+                               kdf: str = "PBKDF2-SHA256", kdf_params: dict = None):
+    """
+    Encrypt a file with a key derived from a password.
+
+    kdf/kdf_params select the key derivation; both are written into the header so
+    decrypt_file_with_password reproduces them. kdf_params=None uses the costs calibrated
+    for this machine (see calibrated_kdf_params). method="auto" picks the faster AEAD
+    (see preferred_aead) and records it in the header like any other method.
+    """
+    if kdf not in KDF_DEFAULTS:
+        raise ValueError(f"Unsupported KDF: {kdf}")
+    if method == "auto":
+        method = preferred_aead()
+    kdf_params = check_kdf_params(kdf, kdf_params or calibrated_kdf_params(kdf))  # Or the file could not be opened
     salt = os.urandom(16)
     if method == "Fernet":
-        key = derive_key_from_password(password, salt, 32)
+        key = base64.urlsafe_b64encode(derive_key(password, salt, 32, kdf, kdf_params, key_cache))
         encrypt_func = encrypt_data_fernet
+    elif method == "ChaCha20-Poly1305":
+        key = derive_key(password, salt, 32, kdf, kdf_params, key_cache)
+        encrypt_func = encrypt_data_chacha20
     elif method.startswith("AES"):
         key_length = 32 if "256" in method else 24 if "192" in method else 16
-        key = derive_key_from_password(password, salt, key_length)
+        key = derive_key(password, salt, key_length, kdf, kdf_params, key_cache)
         mode = "GCM" if "GCM" in method else "CFB"
-        encrypt_func = lambda data: encrypt_data_aes(key, data, mode)
+        encrypt_func = partial(encrypt_data_aes, mode=mode)
     else:
         raise ValueError("Unsupported method")
 
-    # Header: magic (4 bytes), method (1 byte), salt (16 bytes)
-    method_byte = {'Fernet': 'F', 'AES-128': 'A', 'AES-192': 'B', 'AES-256': 'C', 'AES-256-GCM': 'G'}.get(method, 'F')
-    header = b'SVEP' + method_byte.encode() + salt
-    with open(out_path, "wb") as fout:
-        fout.write(header)
-    encrypt_file_in_chunks(encrypt_func, key, in_path, out_path, progress_tracker)
+    header = pack_password_header(PASSWORD_METHODS.get(method, 'F'), kdf, kdf_params, salt)
+    return encrypt_file_in_chunks(encrypt_func, key, in_path, out_path, progress_tracker,
+                                  workers, use_processes, header=header)
 
-def decrypt_file_with_password(password: str, in_path: str, out_path: str, progress_tracker=None):
+def password_file_key(password: str, fin, key_cache=KEY_CACHE):
+    """
+    Read the password header of an open file and derive its key.
+
+    Returns:
+        tuple: (method name, decrypt function, key, offset of the first record)
+    """
+    method_byte, kdf, kdf_params, salt = read_password_header(fin)
+    method_map = {'F': ('Fernet', 32, decrypt_data_fernet),
+                  'A': ('AES-128', 16, partial(decrypt_data_aes, mode="CFB")),
+                  'B': ('AES-192', 24, partial(decrypt_data_aes, mode="CFB")),
+                  'C': ('AES-256', 32, partial(decrypt_data_aes, mode="CFB")),
+                  'G': ('AES-256-GCM', 32, partial(decrypt_data_aes, mode="GCM")),
+                  'H': ('ChaCha20-Poly1305', 32, decrypt_data_chacha20)}
+    if method_byte not in method_map:
+        raise ValueError("Unsupported method in file header")
+    method, key_length, decrypt_func = method_map[method_byte]
+    key = derive_key(password, salt, key_length, kdf, kdf_params, key_cache)
+    if method == "Fernet":
+        key = base64.urlsafe_b64encode(key)
+    return method, decrypt_func, key, fin.tell()
+
+def decrypt_file_with_password(password: str, in_path: str, out_path: str, progress_tracker=None,
+                               workers=None, use_processes=False, key_cache=KEY_CACHE):
     with open(in_path, "rb") as fin:
-        magic = fin.read(4)
-        if magic != b'SVEP':
-            raise ValueError("Invalid file format or not password-encrypted")
-        method_byte = fin.read(1).decode()
-        salt = fin.read(16)
-        method_map = {'F': ('Fernet', 32, decrypt_data_fernet),
-                      'A': ('AES-128', 16, lambda data: decrypt_data_aes(key, data, "CFB")),
-                      'B': ('AES-192', 24, lambda data: decrypt_data_aes(key, data, "CFB")),
-                      'C': ('AES-256', 32, lambda data: decrypt_data_aes(key, data, "CFB")),
-                      'G': ('AES-256-GCM', 32, lambda data: decrypt_data_aes(key, data, "GCM"))}
-        if method_byte not in method_map:
-            raise ValueError("Unsupported method in file header")
-        method, key_length, decrypt_func = method_map[method_byte]
-        key = derive_key_from_password(password, salt, key_length)
-
-    decrypt_file_in_chunks(decrypt_func, key, in_path, out_path, progress_tracker)
\ No newline at end of file
+        _, decrypt_func, key, data_offset = password_file_key(password, fin, key_cache)
+
+    return decrypt_file_in_chunks(decrypt_func, key, in_path, out_path, progress_tracker,
+                                  workers, use_processes, data_offset=data_offset)
@@ -0,0 +1,81 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from encryption import DEFAULT_WORKERS, byte_histogram, histogram_entropy
+from batch import scan_tree
+
+SCAN_READ_SIZE = 1024 * 1024
+SAMPLE_WINDOW_SIZE = 64 * 1024
+RANDOM_THRESHOLD = 7.99  # Bits per byte; encrypted or random data sits at ~8.0
+COMPRESSED_THRESHOLD = 7.5  # Same cut-off compression.py uses to skip a chunk
+SECUREVAULT_MAGICS = (b"SVC2", b"SVEP")
+
+def file_entropy(path, windows=None, window_size=SAMPLE_WINDOW_SIZE, seed=None):
+    """
+    Shannon entropy of a file in bits per byte.
+
+    Args:
+        path (str): File to measure.
+        windows (int): If set, read only this many random windows instead of the whole file.
+        window_size (int): Bytes per sampled window.
+        seed (int): Seed for reproducible window positions.
+    """
+    size = os.path.getsize(path)
+    counts = None
+    with open(path, "rb") as fin:
+        if windows and size > windows * window_size:
+            rng = random.Random(seed)
+            offsets = sorted(rng.randrange(0, size - window_size + 1) for _ in range(windows))
+            blocks = []
+            for offset in offsets:
+                fin.seek(offset)
+                blocks.append(fin.read(window_size))
+        else:
+            blocks = iter(lambda: fin.read(SCAN_READ_SIZE), b"")
+        for block in blocks:
+            histogram = byte_histogram(block)
+            counts = histogram if counts is None else [a + b for a, b in zip(counts, histogram)]
+    return histogram_entropy(counts) if counts is not None else 0.0
+
+def classify_entropy(entropy):
+    """Label an entropy value as 'random' (encrypted or random), 'compressed' or 'plain'."""
+    if entropy >= RANDOM_THRESHOLD:
+        return "random"
+    elif entropy >= COMPRESSED_THRESHOLD:
+        return "compressed"
+    return "plain"
+
+def _scan_file(job):
+    root, rel_path, size, windows, window_size = job
+    path = os.path.join(root, rel_path)
+    result = {"path": rel_path, "size": size}
+    try:
+        with open(path, "rb") as fin:
+            magic = fin.read(4)
+        entropy = file_entropy(path, windows, window_size, seed=rel_path)
+        result["entropy"] = entropy
+        result["class"] = "securevault" if magic in SECUREVAULT_MAGICS else classify_entropy(entropy)
+    except OSError as e:
+        result["error"] = str(e)
+    return result
+
+def scan_entropy(root, workers=None, windows=None, window_size=SAMPLE_WINDOW_SIZE):
+    """
+    Measure the entropy of every file under root in a process pool.
+
+    Args:
+        root (str): Directory to scan.
+        workers (int): Process count (default: DEFAULT_WORKERS).
+        windows (int): Random windows per file for sampled mode; None reads whole files.
+        window_size (int): Bytes per window in sampled mode.
+
+    Returns:
+        list: One dict per file with path, size, entropy and class ('securevault', 'random',
+        'compressed' or 'plain'), or an error field if the file could not be read.
+    """
+    jobs = [(root, rel_path, size, windows, window_size) for rel_path, size in scan_tree(root)]
+    workers = workers or DEFAULT_WORKERS
+    if workers <= 1:
+        return [_scan_file(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_scan_file, jobs, chunksize=max(1, len(jobs) // (workers * 16))))
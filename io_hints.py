@@ -0,0 +1,133 @@
+"""
+Page cache and allocation hints for long sequential jobs.
+
+Encrypting or wiping a file much larger than memory would otherwise push every other
+process's pages out of the cache and leave the output fragmented. Each helper is a no-op
+where the platform lacks the call (fadvise and fallocate are POSIX-only) or the filesystem
+refuses it, so callers never need to check.
+"""
+import os
+import mmap
+import errno
+
+DROP_CACHE_THRESHOLD = 256 * 1024 * 1024  # Files this big are streamed without keeping their pages cached
+DROP_BEHIND_BYTES = 64 * 1024 * 1024  # Pages are released every this many bytes
+SPARSE_MIN_HOLE = 1024 * 1024  # Holes smaller than this are treated as data (zeros)
+DIRECT_IO_ALIGNMENT = 4096  # O_DIRECT offsets, lengths and buffers must be multiples of this
+O_DIRECT = getattr(os, "O_DIRECT", 0)
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+def _fadvise(fd, offset, length, advice_name):
+    advice = getattr(os, advice_name, None)
+    if advice is None:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass  # Pipes, and filesystems that ignore advice
+
+def advise_sequential(fd, offset=0, length=0):
+    """Tell the kernel fd is read front to back, so it reads ahead further (length 0: to the end)."""
+    _fadvise(fd, offset, length, "POSIX_FADV_SEQUENTIAL")
+
+def drop_cache(fd, offset=0, length=0):
+    """Release fd's clean cached pages in the range (length 0: to the end)."""
+    _fadvise(fd, offset, length, "POSIX_FADV_DONTNEED")
+
+def preallocate(fd, length) -> bool:
+    """
+    Reserve length bytes for fd in as few extents as the filesystem allows.
+
+    The file size becomes length, so a writer that ends up shorter must truncate.
+
+    Returns:
+        bool: True if the space was reserved.
+    """
+    if length <= 0 or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, length)
+    except OSError:
+        return False
+    return True
+
+class DropBehind:
+    """
+    Release a streamed file's pages from the cache as the job moves past them.
+
+    Call advance with each chunk read or written. Written pages are dirty and cannot be
+    dropped until they reach the disk, so with flush=True each range is synced first.
+    """
+    def __init__(self, fd, offset=0, flush=False, interval=DROP_BEHIND_BYTES):
+        self.fd = fd
+        self.flush = flush
+        self.interval = interval
+        self._dropped = self._position = offset
+
+    def advance(self, nbytes):
+        self._position += nbytes
+        if self._position - self._dropped >= self.interval:
+            self._drop()
+
+    def finish(self):
+        """Release everything up to the current position."""
+        if self._position > self._dropped:
+            self._drop()
+
+    def _drop(self):
+        if self.flush:
+            _fdatasync(self.fd)
+        drop_cache(self.fd, self._dropped, self._position - self._dropped)
+        self._dropped = self._position
+
+def data_extents(fd, size=None, min_hole=SPARSE_MIN_HOLE):
+    """
+    Find the parts of a file that hold data, using SEEK_DATA/SEEK_HOLE.
+
+    Holes shorter than min_hole are merged into the data around them. Where the platform or
+    filesystem cannot report holes the whole file is one extent. Moves fd's file position.
+
+    Returns:
+        list: (offset, length) of each data extent in file order; empty for an all-hole file.
+    """
+    size = os.fstat(fd).st_size if size is None else size
+    whole = [(0, size)] if size else []
+    if not hasattr(os, "SEEK_DATA"):
+        return whole
+    extents = []
+    position = 0
+    try:
+        while position < size:
+            try:
+                start = os.lseek(fd, position, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break  # Only a hole remains
+                raise
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            if extents and start - (extents[-1][0] + extents[-1][1]) < min_hole:
+                extents[-1] = (extents[-1][0], end - extents[-1][0])
+            else:
+                extents.append((start, end - start))
+            position = end
+    except OSError:
+        return whole
+    return extents
+
+def aligned_buffer(size):
+    """Zeroed, page-aligned writable buffer of size bytes, usable for O_DIRECT writes."""
+    return mmap.mmap(-1, size)
+
+def open_direct(path):
+    """
+    Open path for writing with O_DIRECT, bypassing the page cache.
+
+    Returns:
+        int: File descriptor, or None where O_DIRECT is unavailable or refused (e.g. tmpfs).
+    """
+    if not O_DIRECT:
+        return None
+    try:
+        return os.open(path, os.O_WRONLY | O_DIRECT)
+    except OSError:
+        return None
@@ -1,6 +1,14 @@
 import os
+import hmac
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from cryptography.fernet import Fernet
 
+KEY_CACHE_SIZE = 64  # Derived keys kept in memory
+KEY_CACHE_TTL = 300  # Seconds a derived key stays usable
+
 def generate_fernet_key() -> bytes:
     """Generate a Fernet key."""
     return Fernet.generate_key()
@@ -29,3 +37,159 @@ def generate_key(method="Fernet", size=32):
         return generate_aes_key(size)
     else:
         raise ValueError(f"Unsupported key generation method: {method}")
+
+class DerivedKeyCache:
+    """
+    In-process LRU + time-to-live cache of password-derived keys.
+
+    Entries are indexed by an HMAC of (password, salt, key length, KDF parameters) under a
+    random per-process secret, so the index cannot be brute-forced faster than the KDF itself.
+    Keys are held in bytearrays and zeroed when evicted, expired or cleared.
+    """
+    def __init__(self, max_entries=KEY_CACHE_SIZE, ttl=KEY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()  # index -> (expiry time, bytearray key)
+        self._lock = threading.Lock()
+
+    def make_index(self, password: str, salt: bytes, key_length: int, params: tuple) -> bytes:
+        """Build the cache index for one derivation."""
+        fields = [password.encode(), salt, str(key_length).encode()] + [str(p).encode() for p in params]
+        message = b"".join(len(field).to_bytes(4, "big") + field for field in fields)
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def get(self, index: bytes):
+        """Return the cached key for index, or None on a miss or an expired entry."""
+        with self._lock:
+            entry = self._entries.get(index)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._evict(index)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(index)
+            self.hits += 1
+            return bytes(entry[1])
+
+    def put(self, index: bytes, key: bytes):
+        """Store a derived key, evicting the least recently used entries beyond max_entries."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if index in self._entries:
+                self._evict(index)
+            self._entries[index] = (time.monotonic() + self.ttl, bytearray(key))
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self):
+        """Zero and drop every cached key."""
+        with self._lock:
+            for index in list(self._entries):
+                self._evict(index)
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters and the current size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": len(self._entries)}
+
+    def _evict(self, index):
+        _, key = self._entries.pop(index)
+        key[:] = bytes(len(key))
+        self.evictions += 1
+
+KEY_CACHE = DerivedKeyCache()
+
+KEY_ID_SIZE = 8  # Bytes of key ID stored in container headers
+KEYRING_DIR = os.path.join(os.path.expanduser("~"), ".securevault", "keyring")
+
+def key_id(key: bytes) -> bytes:
+    """Short identifier of a key: a truncated, domain-separated SHA-256 that does not reveal the key."""
+    return hashlib.sha256(b"SecureVault key id\x00" + key).digest()[:KEY_ID_SIZE]
+
+class KeyRing:
+    """
+    Keys indexed by key ID, held in memory.
+
+    A keyring may be backed by a directory of <key id>.key files, read once on first use,
+    so resolving the key of each file in a batch needs neither a prompt nor a disk read.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._keys = {}
+        self._loaded = directory is None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".key"):
+                key = load_fernet_key(os.path.join(self.directory, name))
+                self._keys[key_id(key)] = key
+
+    def add(self, key: bytes, save=False) -> str:
+        """Add a key and return its ID as hex; save=True also writes it to the keyring directory."""
+        kid = key_id(key)
+        with self._lock:
+            self._load()
+            self._keys[kid] = key
+        if save:
+            if self.directory is None:
+                raise ValueError("Keyring has no directory to save keys in")
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            path = os.path.join(self.directory, kid.hex() + ".key")
+            if not os.path.exists(path):
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(key)
+        return kid.hex()
+
+    def add_file(self, path: str, save=False) -> str:
+        """Load a key file into the keyring and return its ID as hex."""
+        return self.add(load_fernet_key(path), save)
+
+    def generate(self, method="Fernet", size=32, save=True) -> str:
+        """Generate a key with generate_key, add it and return its ID as hex."""
+        return self.add(generate_key(method, size), save)
+
+    def get(self, kid) -> bytes:
+        """Return the key for an ID given as bytes or hex; raises KeyError if it is not in the keyring."""
+        if isinstance(kid, str):
+            kid = bytes.fromhex(kid)
+        if not isinstance(kid, bytes):
+            raise TypeError(f"Key ID must be bytes or a hex string, not {type(kid).__name__}")
+        with self._lock:
+            self._load()
+            key = self._keys.get(kid)
+        if key is None:
+            raise KeyError(f"No key with ID {kid.hex()} in the keyring")
+        return key
+
+    def ids(self):
+        """Hex IDs of every key in the keyring."""
+        with self._lock:
+            self._load()
+            return sorted(kid.hex() for kid in self._keys)
+
+    def __contains__(self, kid):
+        if kid is None:  # container_key_id of a file that is not a container, or has no key ID
+            return False
+        try:
+            self.get(kid)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.ids())
+
+KEYRING = KeyRing(KEYRING_DIR)
@@ -0,0 +1,188 @@
+"""
+Lightweight in-process metrics for SecureVault jobs.
+
+Counters and histograms live in REGISTRY and are updated by the encryption, container and
+wipe code as jobs run. Nothing is exported until asked: write_json for ad hoc inspection,
+or write_textfile for node_exporter's textfile collector, e.g.
+
+    REGISTRY.write_textfile("/var/lib/node_exporter/textfile/securevault.prom")
+"""
+import os
+import json
+import math
+import threading
+
+# Seconds; chunk encryption takes microseconds (small chunks) to about a second (16MB Fernet)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# Seconds; a KDF is tuned to a fraction of a second but may be set much higher
+KDF_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# MB/s of one wipe pass, from USB sticks to NVMe
+THROUGHPUT_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2000, 5000)
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic total per label set, e.g. bytes processed by operation."""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in sorted(self._values.items())]
+
+    def prometheus_lines(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {_format_value(value)}"
+                    for key, value in sorted(self._values.items())]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+class Histogram:
+    """Bucketed observations per label set, with their count and sum (Prometheus histogram)."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # label key -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = [counts, total + value, count + 1]
+
+    def samples(self):
+        with self._lock:
+            result = []
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative, buckets = 0, {}
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    buckets[_format_value(bound)] = cumulative
+                result.append({"labels": dict(key), "buckets": buckets, "sum": total, "count": count})
+            return result
+
+    def prometheus_lines(self):
+        lines = []
+        for sample in self.samples():
+            key = _label_key(sample["labels"])
+            for bound, cumulative in sample["buckets"].items():
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(sample['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {sample['count']}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+class MetricsRegistry:
+    """Named metrics, exported together as JSON or Prometheus text format."""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def counter(self, name, help_text) -> Counter:
+        return self._get(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(name, lambda: Histogram(name, help_text, buckets))
+
+    def _sorted(self):
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def as_dict(self) -> dict:
+        return {metric.name: {"type": metric.kind, "help": metric.help, "samples": metric.samples()}
+                for metric in self._sorted()}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for metric in self._sorted():
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def _write(self, path, text):
+        # Write then rename, so a collector never reads a half-written file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+    def write_json(self, path):
+        self._write(path, self.to_json())
+
+    def write_textfile(self, path):
+        """Write Prometheus text format for node_exporter's textfile collector (path ending in .prom)."""
+        self._write(path, self.to_prometheus())
+
+    def reset(self):
+        for metric in self._sorted():
+            metric.reset()
+
+REGISTRY = MetricsRegistry()
+
+BYTES_PROCESSED = REGISTRY.counter("securevault_bytes_processed_total",
+                                   "Bytes read by encrypt and decrypt jobs and overwritten by wipes")
+CHUNK_SECONDS = REGISTRY.histogram("securevault_chunk_seconds", "Time to encrypt or decrypt one chunk")
+KDF_SECONDS = REGISTRY.histogram("securevault_kdf_seconds", "Time to derive a key from a password", KDF_BUCKETS)
+STAGE_BUSY_SECONDS = REGISTRY.counter("securevault_stage_busy_seconds_total",
+                                      "Seconds the read, crypto and write pipeline stages spent working")
+STAGE_IDLE_SECONDS = REGISTRY.counter("securevault_stage_idle_seconds_total",
+                                      "Seconds the read, crypto and write pipeline stages spent waiting")
+WIPE_PASS_MB_PER_SECOND = REGISTRY.histogram("securevault_wipe_pass_mb_per_second",
+                                             "Throughput of each overwrite pass of a wipe", THROUGHPUT_BUCKETS)
+ERRORS = REGISTRY.counter("securevault_errors_total", "Failed operations by operation and exception type")
+
+def record_error(operation, error):
+    """Count a failed operation under its exception type."""
+    ERRORS.inc(operation=operation, error=type(error).__name__)
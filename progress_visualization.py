@@ -1,12 +1,129 @@
+import math
+import time
+import threading
+from collections import namedtuple
+
+PROGRESS_RATE_HZ = 10  # Callback updates per second at most; 0 reports every update
+THROUGHPUT_SMOOTHING_SECONDS = 2.0  # Time constant of the exponentially smoothed throughput
+
+ProgressSnapshot = namedtuple("ProgressSnapshot", "processed total mb_per_second eta")
+
 class ProgressTracker:
-    def __init__(self):
-        self.callback = None
+    """
+    Receives progress from worker threads and reports it at most rate_hz times per second.
+
+    Jobs call update_progress after every chunk; the callback only sees a coalesced update
+    every 1 / rate_hz seconds, plus the one that reaches the total, so a GUI or event loop is
+    not flooded on fast storage. Throughput is smoothed over about smoothing seconds and
+    gives the ETA. Headless callers can pass a callback, or iterate the tracker on another
+    thread; call finish() when the job ends so the last coalesced update is delivered and
+    iteration stops.
+    """
+    def __init__(self, callback=None, rate_hz=PROGRESS_RATE_HZ, smoothing=THROUGHPUT_SMOOTHING_SECONDS):
+        self.callback = callback
+        self.interval = 1.0 / rate_hz if rate_hz else 0.0
+        self.smoothing = smoothing
+        self.processed = 0
+        self.total = 0
+        self.rate = None  # Smoothed bytes per second; None until two updates have been seen
+        self._condition = threading.Condition(threading.RLock())
+        self._sample = None  # (time, processed) of the last rate sample
+        self._last_emit = None
+        self._emitted = 0
+        self._unreported = False
+        self._finished = False
 
     def set_callback(self, callback):
         """Set a callback function to update the GUI."""
         self.callback = callback
 
     def update_progress(self, processed, total):
-        """Update progress and call the callback if set."""
+        """Record progress and call the callback if an update is due."""
+        now = time.monotonic()
+        with self._condition:
+            self._add_sample(now, processed)
+            self.processed, self.total = processed, total
+            if (self._last_emit is None or now - self._last_emit >= self.interval
+                    or (total and processed >= total)):
+                self._last_emit = now
+                self._report()
+            else:
+                self._unreported = True
+
+    def finish(self):
+        """Deliver the last coalesced update, if any, and end iteration."""
+        with self._condition:
+            if self._unreported:
+                self._report()
+            self._finished = True
+            self._condition.notify_all()
+
+    def _add_sample(self, now, processed):
+        if self._sample is None or processed < self._sample[1]:
+            self._sample = (now, processed)  # First update, or the tracker was reused for a new job
+            self.rate = None
+            return
+        elapsed = now - self._sample[0]
+        if elapsed <= 0:
+            return  # Same clock tick; the bytes count towards the next sample
+        instant = (processed - self._sample[1]) / elapsed
+        if self.rate is None or not self.smoothing:
+            self.rate = instant
+        else:
+            self.rate += (1 - math.exp(-elapsed / self.smoothing)) * (instant - self.rate)
+        self._sample = (now, processed)
+
+    def _report(self):
+        self._unreported = False
+        self._emitted += 1
+        self._condition.notify_all()
+        self._emit(self.processed, self.total)
+
+    def _emit(self, processed, total):
+        """Deliver one coalesced update; subclasses may forward it elsewhere too."""
         if self.callback:
-            self.callback(processed, total)
\ No newline at end of file
+            self.callback(processed, total)
+
+    @property
+    def mb_per_second(self):
+        return (self.rate or 0.0) / (1024 * 1024)
+
+    @property
+    def eta(self):
+        """Seconds until the total is reached, or None if the total or the rate is unknown."""
+        if self.total and self.processed >= self.total:
+            return 0.0
+        if not self.total or not self.rate:
+            return None
+        return (self.total - self.processed) / self.rate
+
+    def snapshot(self) -> ProgressSnapshot:
+        with self._condition:
+            return ProgressSnapshot(self.processed, self.total, self.mb_per_second, self.eta)
+
+    def __iter__(self):
+        """Yield a ProgressSnapshot for each reported update until finish() is called."""
+        seen = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._emitted > seen or self._finished)
+                if self._emitted == seen:
+                    return
+                seen = self._emitted
+                snapshot = self.snapshot()
+            yield snapshot
+
+def format_progress(snapshot) -> str:
+    """One-line description such as "12.0 MB / 48.0 MB (25%) at 96.3 MB/s, ETA 0:00:01"."""
+    mb_processed = snapshot.processed / (1024 * 1024)
+    if snapshot.total:
+        text = (f"{mb_processed:.1f} MB / {snapshot.total / (1024 * 1024):.1f} MB "
+                f"({snapshot.processed / snapshot.total:.0%})")
+    else:
+        text = f"{mb_processed:.1f} MB"
+    if snapshot.mb_per_second:
+        text += f" at {snapshot.mb_per_second:.1f} MB/s"
+    if snapshot.eta is not None:
+        eta = int(round(snapshot.eta))
+        text += f", ETA {eta // 3600}:{eta // 60 % 60:02d}:{eta % 60:02d}"
+    return text
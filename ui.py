@@ -14,10 +14,12 @@ from PySide6.QtGui import QIcon, QFont, QPixmap, QColor, QPalette, QAction
 
 # Placeholder imports (replace with your actual modules)
 from encryption import *
-from key_manager import generate_key
+from container import encrypt_container, decrypt_container, is_container, container_key_id
+from key_manager import generate_key, KEYRING
 from secure_wipe import secure_wipe_drive, get_available_wipe_methods, wipe_drive
 from main_content import create_main_content
-from progress_visualization import ProgressTracker
+from progress_visualization import ProgressTracker, format_progress
+from metrics import record_error
 from logs import LogViewer
 
 # Configure logging
@@ -142,6 +144,7 @@ class WipeThread(QThread):
                 self.progress_updated.emit(total_passes, total_passes)
                 self.operation_completed.emit(True, "Wipe completed successfully")
         except Exception as e:
+            record_error("wipe", e)
             self.operation_completed.emit(False, str(e))
     
     def get_directory_size(self, path):
@@ -171,13 +174,14 @@ class CryptoThread(QThread):
     progress_updated = Signal(int, int)
     operation_completed = Signal(bool, str, float)
     
-    def __init__(self, operation, file_path, method_type, out_path, key):
+    def __init__(self, operation, file_path, method_type, out_path, key, workers=None):
         super().__init__()
         self.operation = operation
         self.file_path = file_path
         self.method_type = method_type
         self.out_path = out_path
         self.key = key
+        self.workers = workers or DEFAULT_WORKERS
         self.progress_tracker = ProgressTracker()
         self.progress_tracker.set_callback(self.update_progress)
     
@@ -185,35 +189,43 @@ class CryptoThread(QThread):
         try:
             self.start_time = time.time()
             if self.operation == "encrypt":
-                if self.method_type == "Fernet":
-                    encrypt_file_in_chunks(
-                        encrypt_data_fernet, self.key, self.file_path, 
-                        self.out_path, self.progress_tracker
-                    )
-                else:
-                    encrypt_file_in_chunks(
-                        encrypt_data_aes, self.key, self.file_path, 
-                        self.out_path, self.progress_tracker
-                    )
+                # Containers record the method and key ID, so decrypting needs neither a method choice nor a key prompt
+                encrypt_container(
+                    self.file_path, self.out_path, self.key, self.method_type,
+                    progress_tracker=self.progress_tracker, workers=self.workers
+                )
                 message = "File encrypted successfully"
             else:
-                if self.method_type == "Fernet":
+                if is_container(self.file_path):
+                    decrypt_container(
+                        self.file_path, self.out_path, self.key,
+                        progress_tracker=self.progress_tracker, workers=self.workers
+                    )
+                elif self.method_type == "Fernet":
                     decrypt_file_in_chunks(
                         decrypt_data_fernet, self.key, self.file_path, 
-                        self.out_path, self.progress_tracker
+                        self.out_path, self.progress_tracker, self.workers
+                    )
+                elif self.method_type == "ChaCha20-Poly1305":
+                    decrypt_file_in_chunks(
+                        decrypt_data_chacha20, self.key, self.file_path,
+                        self.out_path, self.progress_tracker, self.workers
                     )
                 else:
                     decrypt_file_in_chunks(
                         decrypt_data_aes, self.key, self.file_path, 
-                        self.out_path, self.progress_tracker
+                        self.out_path, self.progress_tracker, self.workers
                     )
                 message = "File decrypted successfully"
+            self.progress_tracker.finish()
             elapsed_time = time.time() - self.start_time
             self.operation_completed.emit(True, message, elapsed_time)
         except Exception as e:
+            record_error(self.operation, e)
             self.operation_completed.emit(False, str(e), 0.0)
     
     def update_progress(self, processed, total):
+        # Called at most PROGRESS_RATE_HZ times a second, not once per chunk
         self.progress_updated.emit(processed, total)
 
 class SecureVaultApp(QMainWindow):
@@ -225,9 +237,13 @@ class SecureVaultApp(QMainWindow):
         
         self.ENCRYPTION_MAP = {
             "Fernet (default)": ("Fernet", 32),
-            "AES-128": ("AES", 16),
-            "AES-192": ("AES", 24),
-            "AES-256": ("AES", 32)
+            "AES-128": ("AES-128", 16),
+            "AES-192": ("AES-192", 24),
+            "AES-256": ("AES-256", 32),
+            "AES-256-GCM (stream)": ("AES-256-GCM-STREAM", 32),
+            "ChaCha20-Poly1305 (stream)": ("ChaCha20-Poly1305-STREAM", 32),
+            "ChaCha20-Poly1305": ("ChaCha20-Poly1305", 32),
+            "Auto (fastest AEAD)": ("auto", 32)
         }
         self.current_key = None
         self.progress_tracker = ProgressTracker()
@@ -510,8 +526,9 @@ class SecureVaultApp(QMainWindow):
             
             if method_type == "Fernet" and not self.validate_fernet_key(key):
                 raise ValueError("Invalid Fernet key for selected method")
-            elif method_type == "AES" and len(key) != key_size:
+            elif method_type != "Fernet" and len(key) != key_size:
                 raise ValueError(f"Key size ({len(key)*8} bits) does not match {method_name}")
+            KEYRING.add(key)  # Containers record its key ID, so decrypting them later needs no prompt
             
             out_path = f"{file_path}.enc"
             self.show_progress_dialog("Encrypting File", "encrypt", file_path, method_type, out_path, key)
@@ -529,23 +546,28 @@ class SecureVaultApp(QMainWindow):
             if not file_path:
                 return
             
-            key_path, _ = QFileDialog.getOpenFileName(
-                self, "Select Encryption Key", "", "Key Files (*.key)"
-            )
-            
-            if not key_path:
-                return
-            
-            with open(key_path, "rb") as f:
-                key = f.read()
-            
             method_name = self.encryption_method_combo.currentText()
             method_type, key_size = self.ENCRYPTION_MAP[method_name]
             
-            if method_type == "Fernet" and not self.validate_fernet_key(key):
-                raise ValueError("Invalid Fernet key for selected method")
-            elif method_type == "AES" and len(key) != key_size:
-                raise ValueError(f"Key size ({len(key)*8} bits) does not match {method_name}")
+            if container_key_id(file_path) in KEYRING:
+                key = KEYRING  # decrypt_container picks the key named in the header
+            else:
+                key_path, _ = QFileDialog.getOpenFileName(
+                    self, "Select Encryption Key", "", "Key Files (*.key)"
+                )
+                
+                if not key_path:
+                    return
+                
+                with open(key_path, "rb") as f:
+                    key = f.read()
+                
+                if is_container(file_path):
+                    KEYRING.add(key)
+                elif method_type == "Fernet" and not self.validate_fernet_key(key):
+                    raise ValueError("Invalid Fernet key for selected method")
+                elif method_type != "Fernet" and len(key) != key_size:
+                    raise ValueError(f"Key size ({len(key)*8} bits) does not match {method_name}")
             
             out_path = file_path[:-4] if file_path.endswith('.enc') else f"{file_path}.dec"
             self.show_progress_dialog("Decrypting File", "decrypt", file_path, method_type, out_path, key)
@@ -635,8 +657,10 @@ class SecureVaultApp(QMainWindow):
         layout.addLayout(button_layout)
         
         self.crypto_thread = CryptoThread(operation, file_path, method_type, out_path, key)
+        tracker = self.crypto_thread.progress_tracker
         self.crypto_thread.progress_updated.connect(
-            lambda processed, total: self.update_crypto_progress(progress_bar, progress_label, processed, total)
+            lambda processed, total: self.update_crypto_progress(progress_bar, progress_label, processed, total,
+                                                                 tracker)
         )
         self.crypto_thread.operation_completed.connect(
             lambda success, message, elapsed_time: self.handle_crypto_completion(
@@ -649,12 +673,10 @@ class SecureVaultApp(QMainWindow):
         
         dialog.show()
     
-    def update_crypto_progress(self, progress_bar, progress_label, processed, total):
+    def update_crypto_progress(self, progress_bar, progress_label, processed, total, tracker):
         percent = int(processed / total * 100) if total > 0 else 0
         progress_bar.setValue(percent)
-        mb_processed = processed / (1024 * 1024)
-        mb_total = total / (1024 * 1024)
-        progress_label.setText(f"Processed: {mb_processed:.2f} MB / {mb_total:.2f} MB")
+        progress_label.setText(f"Processed: {format_progress(tracker.snapshot())}")
     
     def handle_crypto_completion(self, success, message, elapsed_time, dialog, operation, file_path, method_type, out_path):
         dialog.close()
@@ -913,4 +935,4 @@ if __name__ == "__main__":
     app = QApplication([])
     window = SecureVaultApp()
     window.show()
-    app.exec()
\ No newline at end of file
+    app.exec()
\ No newline at end of file
@@ -0,0 +1,166 @@
+import os
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from cryptography.exceptions import InvalidTag
+from encryption import (DEFAULT_WORKERS, process_chunks, decrypt_data_fernet, decrypt_data_aes,
+                        decrypt_data_chacha20, number_chunks, password_file_key)
+from container import (MAGIC, RECORD, RECORD_END, STREAM_METHODS, read_header, read_index, chunk_decryptor)
+from batch import MANIFEST_NAME, scan_tree
+
+VerifyResult = namedtuple("VerifyResult", "path ok chunks bad_chunk bad_offset error")
+
+# Methods whose chunks carry an authentication tag (Fernet HMAC, GCM or Poly1305)
+AUTHENTICATED_METHODS = ("Fernet", "AES-256-GCM", "ChaCha20-Poly1305") + tuple(STREAM_METHODS)
+# Decrypt functions for files written by encrypt_file_in_chunks, which have no header
+CHUNKED_DECRYPT = {"Fernet": decrypt_data_fernet, "AES-256-GCM": partial(decrypt_data_aes, mode="GCM"),
+                   "ChaCha20-Poly1305": decrypt_data_chacha20}
+
+# Per-file failures a batch reports instead of stopping on: unreadable or malformed files, a
+# wrapped data key that the key does not open (InvalidTag) and key IDs missing from a KeyRing (KeyError)
+VERIFY_ERRORS = (OSError, ValueError, KeyError, InvalidTag)
+
+def describe_error(error):
+    """Message for a failed file: KeyError's str() adds quotes and InvalidTag has no message."""
+    if isinstance(error, KeyError) and error.args:
+        return str(error.args[0])
+    return str(error) or type(error).__name__
+
+class TruncatedRecord(ValueError):
+    """A record or the END marker is cut short; offset is where the record starts."""
+    def __init__(self, message, offset):
+        super().__init__(f"{message} at offset {offset}")
+        self.offset = offset
+
+def _check_chunk(context, chunk):
+    """process_chunks function: decrypt one chunk, discard the plaintext and return the error or None."""
+    decrypt_func, key = context
+    try:
+        decrypt_func(key, chunk)
+    except Exception as e:
+        return str(e) or type(e).__name__
+    return None
+
+def _container_records(fin, offsets):
+    """Yield container record payloads, appending each record's file offset to offsets."""
+    while True:
+        offset = fin.tell()
+        record = fin.read(RECORD.size)
+        if len(record) < RECORD.size:
+            raise TruncatedRecord("Truncated container: missing END record", offset)
+        length, flags = RECORD.unpack(record)
+        if flags & RECORD_END:
+            return
+        data = fin.read(length)
+        if len(data) < length:
+            raise TruncatedRecord("Truncated chunk", offset)
+        offsets.append(offset)
+        yield data
+
+def _chunked_records(fin, offsets):
+    """Yield encrypt_file_in_chunks record payloads, appending each record's file offset to offsets."""
+    while True:
+        offset = fin.tell()
+        length_bytes = fin.read(4)
+        if not length_bytes:
+            return
+        length = int.from_bytes(length_bytes, "big")
+        data = fin.read(length)
+        if len(length_bytes) < 4 or len(data) < length:
+            raise TruncatedRecord("Truncated chunk", offset)
+        offsets.append(offset)
+        yield data
+
+def _verify_records(path, records, offsets, decrypt_func, key, workers):
+    chunks = 0
+    try:
+        for _, error in process_chunks(_check_chunk, (decrypt_func, key), records, workers):
+            offset = offsets.popleft()
+            if error is not None:
+                return VerifyResult(path, False, chunks, chunks, offset, error)
+            chunks += 1
+    except TruncatedRecord as e:
+        return VerifyResult(path, False, chunks, chunks, e.offset, str(e))
+    return VerifyResult(path, True, chunks, None, None, None)
+
+def verify_file(path, key, method=None, workers=None):
+    """
+    Check every chunk's authentication tag without writing any plaintext.
+
+    Chunks are decrypted in parallel and the plaintext is discarded. Containers (see
+    container.py) name their method in the header. Files written by encrypt_file_in_chunks
+    need method: "Fernet", "AES-256-GCM" or "ChaCha20-Poly1305". AES-CFB files have no tag and cannot be
+    verified.
+
+    Args:
+        path (str): Encrypted file.
+        key (bytes): Key the file was encrypted with.
+        method (str): Method for headerless chunked files.
+        workers (int): Parallel chunk workers.
+
+    Returns:
+        VerifyResult: ok, the number of good chunks, and for a failure the first bad chunk's
+        number, its record offset in the file and the error.
+    """
+    offsets = deque()
+    with open(path, "rb") as fin:
+        magic = fin.read(4)
+        fin.seek(0)
+        if magic == MAGIC:
+            header = read_header(fin)
+            if header.method not in AUTHENTICATED_METHODS:
+                raise ValueError(f"{header.method} has no authentication tag to verify")
+            decrypt_func, chunk_key = chunk_decryptor(header, key)
+            records = _container_records(fin, offsets)
+            if header.method in STREAM_METHODS:
+                records = number_chunks(records)  # A missing final chunk fails the last-chunk tag
+            result = _verify_records(path, records, offsets, decrypt_func, chunk_key, workers)
+            if result.ok:
+                end_offset = fin.tell()
+                try:
+                    index = read_index(fin)
+                except ValueError as e:
+                    return VerifyResult(path, False, result.chunks, None, end_offset, str(e))
+                if len(index) != result.chunks:
+                    return VerifyResult(path, False, result.chunks, None, end_offset,
+                                        "Index does not match the chunk records")
+            return result
+        if magic == b"SVEP":
+            raise ValueError("Password-encrypted file; use verify_file_with_password")
+        if method not in CHUNKED_DECRYPT:
+            raise ValueError(f"Chunked files need method set to one of {', '.join(CHUNKED_DECRYPT)} to be verified")
+        return _verify_records(path, _chunked_records(fin, offsets), offsets, CHUNKED_DECRYPT[method], key, workers)
+
+def verify_file_with_password(path, password, workers=None):
+    """verify_file for a file written by encrypt_file_with_password."""
+    offsets = deque()
+    with open(path, "rb") as fin:
+        method, decrypt_func, key, _ = password_file_key(password, fin)
+        if method not in AUTHENTICATED_METHODS:
+            raise ValueError(f"{method} has no authentication tag to verify")
+        return _verify_records(path, _chunked_records(fin, offsets), offsets, decrypt_func, key, workers)
+
+def verify_tree(root, key, method=None, workers=None):
+    """
+    Verify every encrypted file under root, several files at a time.
+
+    Files that cannot be verified (unauthenticated method, missing method, unreadable, key
+    not in the keyring or not the one that wrapped the data key) get ok=False with the
+    reason in error rather than stopping the batch.
+
+    Returns:
+        list: VerifyResult per file, with paths relative to root.
+    """
+    workers = workers or DEFAULT_WORKERS
+
+    def verify_one(rel_path):
+        try:
+            result = verify_file(os.path.join(root, rel_path), key, method, workers=1)
+            return result._replace(path=rel_path)
+        except VERIFY_ERRORS as e:
+            return VerifyResult(rel_path, False, 0, None, None, describe_error(e))
+
+    files = [rel_path for rel_path, _ in sorted(scan_tree(root), key=lambda item: item[1], reverse=True)
+             if os.path.basename(rel_path) != MANIFEST_NAME]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sorted(executor.map(verify_one, files), key=lambda result: result.path)